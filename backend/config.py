@@ -26,8 +26,142 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Pool de connexions partagé par les routes /articles
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+
+# Listing /articles/ : taille des pages et des lots lus par le curseur serveur en mode flux
+ARTICLES_PAGE_SIZE = int(os.getenv("ARTICLES_PAGE_SIZE", "100"))
+ARTICLES_PAGE_MAX_SIZE = int(os.getenv("ARTICLES_PAGE_MAX_SIZE", "1000"))
+ARTICLES_STREAM_BATCH_SIZE = int(os.getenv("ARTICLES_STREAM_BATCH_SIZE", "500"))
+
 WEB_ACTION_URL = "http://127.0.0.1:8000/articles/search/"
 
+# --- Clients HTTP partagés (pool keep-alive) ---
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# --- Client LLM (délais, nouvelles tentatives, hedging, disjoncteur) ---
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+# --- Cache de configuration des chatbots ---
+CHATBOT_CONFIG_TTL = float(os.getenv("CHATBOT_CONFIG_TTL", "300"))
+CHATBOT_CONFIG_MAXSIZE = int(os.getenv("CHATBOT_CONFIG_MAXSIZE", "1024"))
+
+# --- Cache des réponses (memory | sqlite | redis) ---
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory").lower()
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_SQLITE_PATH = os.getenv("ANSWER_CACHE_SQLITE_PATH", "answer_cache.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL")
+
+# --- Cache sémantique (réponses réutilisées pour des questions proches) ---
+# Désactivé par défaut ; jamais utilisé pour les chatbots à slots, connexions PostgreSQL ou raisonnement SQL
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# Chatbots gardés en mémoire (un index de SEMANTIC_CACHE_MAX_ENTRIES vecteurs chacun)
+SEMANTIC_CACHE_MAX_NAMESPACES = int(os.getenv("SEMANTIC_CACHE_MAX_NAMESPACES", "64"))
+
+# --- Embeddings : "api" (Space Hugging Face) ou "local" (sentence-transformers ONNX sur CPU) ---
+# Le modèle local doit être celui qui a servi à indexer les collections Qdrant.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "api").lower()
+EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL", "https://madachat-embedder.hf.space/embed")
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))
+EMBEDDING_RETRIES = int(os.getenv("EMBEDDING_RETRIES", "2"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")  # niveau disque désactivé si absent
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.getenv("EMBEDDING_CACHE_DISK_CAPACITY", "500000"))
+
+# --- Recherche hybride (Qdrant + plein texte PostgreSQL, fusion RRF) ---
+# Sources documentaires des chatbots dont le contenu est aussi dans la table locale `articles`
+ARTICLES_SOURCE_NAMES = [s.strip() for s in os.getenv("ARTICLES_SOURCE_NAMES", "").split(",") if s.strip()]
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "6"))
+# Restreint la recherche hybride aux catégories détectées dans la question
+# (repli sans filtre, par recherche, si rien n'est trouvé)
+ARTICLES_CATEGORY_FILTER = os.getenv("ARTICLES_CATEGORY_FILTER", "false").lower() == "true"
+
+# --- Classifieur question / demande (modèles scikit-learn livrés avec le backend) ---
+CLASSIFIER_MODEL_PATH = os.getenv(
+    "CLASSIFIER_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_classifier_model.pkl")
+)
+CLASSIFIER_VECTORIZER_PATH = os.getenv(
+    "CLASSIFIER_VECTORIZER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_vectorizer.pkl")
+)
+# Probabilité "demande" à partir de laquelle un message est clarifié et routé vers les documents
+CLASSIFIER_REQUEST_THRESHOLD = float(os.getenv("CLASSIFIER_REQUEST_THRESHOLD", "0.5"))
+CLASSIFIER_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFIER_CACHE_MAX_ENTRIES", "10000"))
+
+# --- Cache des clarifications (résolution des coréférences) ---
+CLARIFY_CACHE_TTL = float(os.getenv("CLARIFY_CACHE_TTL", "3600"))
+CLARIFY_CACHE_MAX_ENTRIES = int(os.getenv("CLARIFY_CACHE_MAX_ENTRIES", "5000"))
+
+# --- Routage des sources par embeddings (repli sur le LLM si le choix est ambigu) ---
+SOURCE_ROUTER_ENABLED = os.getenv("SOURCE_ROUTER_ENABLED", "true").lower() == "true"
+# Similarité cosinus minimale de la meilleure source (propre au modèle d'embedding)
+SOURCE_ROUTER_MIN_SCORE = float(os.getenv("SOURCE_ROUTER_MIN_SCORE", "0.35"))
+# Sources retenues ensemble si leur score est à moins de cette marge du meilleur
+SOURCE_ROUTER_MARGIN = float(os.getenv("SOURCE_ROUTER_MARGIN", "0.05"))
+# Écart minimal entre la sélection et la meilleure source écartée, sinon appel LLM
+SOURCE_ROUTER_AMBIGUITY_GAP = float(os.getenv("SOURCE_ROUTER_AMBIGUITY_GAP", "0.05"))
+SOURCE_ROUTER_CACHE_MAX_ENTRIES = int(os.getenv("SOURCE_ROUTER_CACHE_MAX_ENTRIES", "1024"))
+
+# --- Reclassement local des documents (cross-encoder sur CPU) ---
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+# Candidats demandés à Qdrant (plus que sans reclassement), puis documents conservés
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+
+# --- Budget de contexte des prompts (comptage des tokens, déduplication, troncature) ---
+# Dépôt Hugging Face public (sans accès restreint) portant le tokenizer de Mixtral,
+# ou chemin local vers un fichier tokenizer.json
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "TheBloke/Mixtral-8x7B-Instruct-v0.1-GPTQ")
+# Fenêtre de contexte par modèle, au format "modele:tokens,modele:tokens"
+CONTEXT_WINDOWS = {
+    name.strip(): int(size)
+    for name, size in (
+        item.split(":") for item in os.getenv("CONTEXT_WINDOWS", "mixtral:32768").split(",") if ":" in item
+    )
+}
+# Plafond du contexte documentaire : des prompts plus courts sont aussi plus rapides
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+CONTEXT_SAFETY_MARGIN = int(os.getenv("CONTEXT_SAFETY_MARGIN", "256"))
+CONTEXT_MIN_DOC_TOKENS = int(os.getenv("CONTEXT_MIN_DOC_TOKENS", "64"))
+CONTEXT_DEDUP_MAX_DISTANCE = int(os.getenv("CONTEXT_DEDUP_MAX_DISTANCE", "3"))
+CONTEXT_ROWS_MAX_TOKENS = int(os.getenv("CONTEXT_ROWS_MAX_TOKENS", "1500"))
+
+# --- Pipeline /ask ---
+# "single" : clarification + sélection des sources en un appel JSON, réponse rédigée directement
+# dans le style final ; "multi" : chaîne d'appels d'origine (clarification, sources, réponse, reformulation)
+ASK_PIPELINE_MODE = os.getenv("ASK_PIPELINE_MODE", "single").lower()
+
+# --- Cache des templates rendus par le service PostgreSQL ---
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", "60"))
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "2000"))
+
 import os
 import psycopg2
 
@@ -35,10 +169,17 @@ def get_connection(dbname: str = None):
     """
     Retourne une connexion PostgreSQL
     """
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=dbname or DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
\ No newline at end of file
+    return psycopg2.connect(**connection_params(dbname))
+
+
+def connection_params(dbname: str = None) -> dict:
+    """
+    Paramètres de connexion PostgreSQL (partagés avec le pool de services/db_pool.py)
+    """
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "dbname": dbname or DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+    }
\ No newline at end of file
@@ -1,13 +1,36 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from routes.ask import router as ask_router
 from routes.articles import router as articles_router  # ✅ importer le nouveau router
+from routes.chatbots import router as chatbots_router
+from services.http_client import init_http_clients, close_http_clients
+from services.db_pool import db_pool
+from services.context_budget import token_counter
 
 from config import *
 import psycopg2
 
-app = FastAPI(title="RAG API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pools HTTP keep-alive partagés par toutes les requêtes /ask
+    await init_http_clients("llm", "embedding", "sql", "render")
+    # Tokenizer du budget de contexte chargé avant la première requête
+    await run_in_threadpool(token_counter.count, "préchargement")
+    # Pool PostgreSQL des routes /articles (ouvert au premier appel si la base est injoignable ici)
+    try:
+        db_pool.open()
+    except Exception as e:
+        print(f"⚠️ Pool PostgreSQL non initialisé au démarrage : {e}")
+    yield
+    await close_http_clients()
+    db_pool.close()
+
+
+app = FastAPI(title="RAG API", lifespan=lifespan)
 
 # CORS (à adapter pour la prod)
 app.add_middleware(
@@ -21,6 +44,7 @@ app.add_middleware(
 # Inclusions de routes
 app.include_router(ask_router)
 app.include_router(articles_router)   # ✅  les routes d'articles
+app.include_router(chatbots_router)   # invalidation du cache de configuration
 
 # Pour lancement direct
 if __name__ == "__main__":
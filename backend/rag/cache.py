@@ -1,11 +1,2 @@
-import json
-_cache = {}
-
-
-def get_cache(query, docs):
-    key = (query, json.dumps(docs, sort_keys=True))
-    return _cache.get(key)
-
-def set_cache(query, docs, result):
-    key = (query, json.dumps(docs, sort_keys=True))
-    _cache[key] = result
\ No newline at end of file
+# Doublon historique de services/cache.py : on réutilise le cache borné partagé
+from services.cache import get_cache, set_cache, make_cache_key
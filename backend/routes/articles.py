@@ -1,107 +1,229 @@
 # routes/articles.py
-from fastapi import APIRouter, HTTPException
+import base64
+import json
+from contextlib import contextmanager, ExitStack
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import psycopg2
-from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from config import ARTICLES_PAGE_SIZE, ARTICLES_PAGE_MAX_SIZE, ARTICLES_STREAM_BATCH_SIZE, ARTICLES_SOURCE_NAMES
+from services.db_pool import db_pool, PoolTimeout
+from services.article_search import fulltext_search
+from services.embedding import get_embedding
+from services.hybrid_search import hybrid_search
+from services.retrieval import qdrant_client
+from utils.article_numbers import numero_sort_key
 
 router = APIRouter(prefix="/articles", tags=["Articles"])
 
 
-# --- Connexion à la base ---
+# --- Connexion à la base (empruntée au pool partagé) ---
+@contextmanager
 def get_connection():
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        return conn
-    except Exception as e:
+        with db_pool.connection() as conn:
+            yield conn
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Base de données saturée : {str(e)}")
+    except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Erreur de connexion à la base : {str(e)}")
 
 
-# --- Route pour tous les articles ---
-@router.get("/")
-def get_articles():
+# --- Métriques du pool de connexions ---
+@router.get("/pool/stats")
+def get_pool_stats():
+    return db_pool.stats()
+
+
+# --- Colonnes renvoyées selon le paramètre `fields` ---
+ARTICLE_FIELDS = {
+    "numero": ["numero"],
+    "full": ["numero", "contenu"],
+}
+
+
+def _encode_cursor(numero_tri, article_id) -> str:
+    """Curseur opaque : clé de tri et id du dernier article (id départage les numéros identiques)."""
+    raw = json.dumps([numero_tri, article_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(after: str):
+    try:
+        numero_tri, article_id = json.loads(base64.urlsafe_b64decode(after.encode("ascii")))
+        if not isinstance(article_id, int) or not (
+            numero_tri is None or (isinstance(numero_tri, list) and all(isinstance(n, int) for n in numero_tri))
+        ):
+            raise ValueError(after)
+        return numero_tri, article_id
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail=f"Curseur invalide : {after}")
+
+
+def _listing_query(columns, after, limit=None):
+    """
+    Ordre naturel (221-2 avant 221-10) puis id, servi par l'index (numero_tri, id).
+    Les numéros sans clé de tri (numero_tri NULL, format non reconnu) viennent en dernier.
+    Les deux dernières colonnes sélectionnées (numero_tri, id) servent au curseur.
+    """
+    sql = f"SELECT {', '.join(columns)}, numero_tri, id FROM articles"
+    params = []
+    if after is not None:
+        after_key, after_id = _decode_cursor(after)
+        if after_key is None:
+            sql += " WHERE numero_tri IS NULL AND id > %s"
+            params.append(after_id)
+        else:
+            sql += " WHERE (numero_tri > %s OR (numero_tri = %s AND id > %s) OR numero_tri IS NULL)"
+            params += [after_key, after_key, after_id]
+    sql += " ORDER BY numero_tri NULLS LAST, id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+def _stream_articles(stack: ExitStack, conn, columns, sql, params):
+    """
+    Parcourt la table avec un curseur serveur nommé : seules `itersize` lignes
+    sont en mémoire à la fois, quelle que soit la taille de la table.
+    Le générateur termine lui-même la transaction puis rend la connexion (`stack`),
+    y compris s'il est fermé en cours de route (client déconnecté).
+    """
+    with stack:
+        # Un curseur nommé (DECLARE) exige une transaction
+        conn.autocommit = False
+        try:
+            with conn.cursor(name="articles_stream") as cur:
+                cur.itersize = ARTICLES_STREAM_BATCH_SIZE
+                cur.execute(sql, params)
+                for row in cur:
+                    yield json.dumps(dict(zip(columns, row[:len(columns)])), ensure_ascii=False) + "\n"
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+
+
+def _close_stream(rows, stack: ExitStack):
+    """Tâche de fin de réponse : ferme le générateur, qui rend lui-même la connexion."""
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT numero, contenu FROM articles ORDER BY numero;")
+        rows.close()
+    except ValueError:
+        # Générateur en cours d'exécution dans un autre thread : il rendra la connexion en se terminant
+        return
+    # Générateur jamais démarré (déconnexion avant la première ligne) : rien n'a été emprunté par lui
+    stack.close()
+
+
+# --- Route pour tous les articles (pagination par curseur ou flux NDJSON) ---
+@router.get("/")
+def get_articles(
+    limit: int = Query(ARTICLES_PAGE_SIZE, ge=1, le=ARTICLES_PAGE_MAX_SIZE),
+    after: Optional[str] = Query(None, description="Curseur : `next_cursor` de la page précédente"),
+    fields: Literal["numero", "full"] = "full",
+    stream: bool = Query(False, description="Renvoie tous les articles en NDJSON (limit ignoré)"),
+):
+    columns = ARTICLE_FIELDS[fields]
+
+    if stream:
+        sql, params = _listing_query(columns, after)
+        # La connexion est empruntée avant de répondre : une base indisponible donne
+        # encore un code d'erreur HTTP, et elle est rendue à la fin du flux
+        stack = ExitStack()
+        conn = stack.enter_context(get_connection())
+        rows = _stream_articles(stack, conn, columns, sql, params)
+        return StreamingResponse(
+            rows,
+            media_type="application/x-ndjson",
+            background=BackgroundTask(_close_stream, rows, stack),
+        )
+
+    # Une ligne de plus que demandé indique s'il reste une page suivante
+    sql, params = _listing_query(columns, after, limit + 1)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
         rows = cur.fetchall()
-        return [{"numero": r[0], "contenu": r[1]} for r in rows]
-    finally:
-        cur.close()
-        conn.close()
+
+    articles = [dict(zip(columns, r[:len(columns)])) for r in rows[:limit]]
+    next_cursor = _encode_cursor(*rows[limit - 1][-2:]) if len(rows) > limit else None
+    return {"articles": articles, "next_cursor": next_cursor}
+
+
+# --- Recherche hybride : Qdrant + plein texte, fusion RRF ---
+@router.get("/hybrid-search")
+async def hybrid_search_articles(q: str, limit: int = Query(6, ge=1, le=50)):
+    """
+    Combine la recherche sémantique (Qdrant, sources ARTICLES_SOURCE_NAMES)
+    et la recherche plein texte PostgreSQL, fusionnées par rang (RRF).
+    Sans ARTICLES_SOURCE_NAMES, aucune des deux recherches n'a de source : 503.
+    """
+    if not ARTICLES_SOURCE_NAMES:
+        raise HTTPException(
+            status_code=503,
+            detail="Recherche hybride non configurée : ARTICLES_SOURCE_NAMES est vide",
+        )
+    if not q or not q.strip():
+        return {"question": q, "documents": []}
+
+    embeddings = await get_embedding([q])
+    documents = await hybrid_search(
+        qdrant_client, q, embeddings[0] if embeddings is not None else None,
+        ARTICLES_SOURCE_NAMES, k=limit,
+    )
+    return {"question": q, "documents": documents}
 
 
 # --- Route pour un article spécifique ---
 @router.get("/{numero}")
 def get_article(numero: str):
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT numero, contenu FROM articles WHERE numero = %s;", (numero,))
-        row = cur.fetchone()
+    """
+    Accepte les formes libres : "Article 221-1", "221-1", "R625-1", "art. 221-5-1 A"...
+    Si plusieurs articles partagent le numéro (plusieurs codes), celui du code par défaut
+    (code NULL) est renvoyé, puis le plus ancien.
+    """
+    key = numero_sort_key(numero)
+    with get_connection() as conn, conn.cursor() as cur:
+        row = None
+        if key is not None:
+            cur.execute(
+                "SELECT numero, contenu FROM articles WHERE numero_tri = %s ORDER BY code NULLS FIRST, id LIMIT 1;",
+                (key,),
+            )
+            row = cur.fetchone()
         if not row:
-            raise HTTPException(status_code=404, detail="Article non trouvé")
-        return {"numero": row[0], "contenu": row[1]}
-    finally:
-        cur.close()
-        conn.close()
-
-
-# --- Route recherche dynamique (avec stemming et tolérance) ---
+            # Numéro non reconnu, ou ligne sans numero_tri (importée avant son ajout)
+            cur.execute(
+                "SELECT numero, contenu FROM articles WHERE numero = %s ORDER BY code NULLS FIRST, id LIMIT 1;",
+                (numero,),
+            )
+            row = cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Article non trouvé")
+    return {"numero": row[0], "contenu": row[1]}
+
+
+# --- Route recherche dynamique (classement par pertinence et tolérance aux fautes) ---
 @router.get("/search/")
-def search_articles(q: str):
+def search_articles(
+    q: str,
+    limit: int = Query(5, ge=1, le=50),
+    categorie: Optional[List[str]] = Query(None, description="Restreint à ces catégories"),
+):
     """
-    Recherche un article par mot-clé (avec formes similaires).
+    Recherche des articles par mots-clés, classés par pertinence.
     Exemples :
       - "enfants" trouve aussi "enfant"
-      - "mariages" trouve aussi "mariage"
+      - "vol -violence" exclut les articles parlant de violence
+      - "homicde involontaire" (faute de frappe) passe par la recherche floue
     """
     if not q or not q.strip():
         return {"mot_cle": None, "articles": []}
 
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        mots = [w.strip() for w in q.split() if w.strip()]
-        query_text = " & ".join(mots)
-
-        # 1️⃣ Recherche full-text PostgreSQL avec dictionnaire français
-        cur.execute("""
-            SELECT numero, contenu
-            FROM articles
-            WHERE to_tsvector('french', contenu) @@ to_tsquery('french', %s)
-            ORDER BY numero
-            LIMIT 5;
-        """, (query_text,))
-        rows = cur.fetchall()
+    mots = [w.strip() for w in q.split() if w.strip()]
+
+    with get_connection() as conn, conn.cursor() as cur:
+        results = fulltext_search(cur, q, limit, categorie)
+    mot_cle = mots[0] if mots else None
 
-        # 2️⃣ Si aucun résultat, recherche souple avec ILIKE
-        if not rows:
-            conditions = []
-            params = []
-            for mot in mots:
-                conditions.append("contenu ILIKE %s")
-                params.append(f"%{mot}%")
-            sql_query = f"""
-                SELECT numero, contenu
-                FROM articles
-                WHERE {" OR ".join(conditions)}
-                ORDER BY numero
-                LIMIT 5;
-            """
-            cur.execute(sql_query, params)
-            rows = cur.fetchall()
-
-        results = [{"numero": r[0], "contenu": r[1]} for r in rows]
-        mot_cle = mots[0] if mots else None
-
-        return {"mot_cle": mot_cle, "articles": results}
-
-    finally:
-        cur.close()
-        conn.close()
+    return {"mot_cle": mot_cle, "articles": results}
@@ -1,26 +1,38 @@
 import re
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Union
-from services.retrieval import retrieve_documents
-from services.mixtral import ask_mixtral_for_relevant_sources, generate_answer,is_question_or_request,extract_slots_with_llm, reformulate_answer_via_llm, call_llm
-from services.clarifier import clarify_question
+from services.retrieval import search_collections, qdrant_client
+from services.hybrid_search import hybrid_search, lexical_sources
+from services.mixtral import ask_mixtral_for_relevant_sources, generate_answer,extract_slots_with_llm, reformulate_answer_via_llm, call_llm, stream_llm, CONSIGNES_STYLE_FINAL
+from services.stages import run_stages
+from services.chatbot_config import get_chatbot_config
+from services.cache import cache_stats
+from services.semantic_cache import semantic_cache
+from services.embedding import get_embedding, embedding_cache
+from services.clarifier import clarify_question, needs_coreference
+from services.planner import plan_request
+from services.source_router import source_router
+from services.context_budget import format_rows
+from services.reranker import reranker
+from services.classifier import request_classifier
+from services.llm_client import llm_client, LLMError
 from utils.helpers import (
     get_connexions_for_chatbot,
     get_documents_for_chatbot,
-    get_slots_for_chatbot,
-    get_memoire_contextuelle,
     get_slot_events_for_chatbot,
     get_web_action_by_id,
     get_event_web_action_urls
 )
-from qdrant_client import QdrantClient
 from config import *
 import json
 
 router = APIRouter()
 
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+client = qdrant_client
 
 class Reasoning(BaseModel):
     sources: List[str]
@@ -44,32 +56,155 @@ class QuestionRequest(BaseModel):
     history: Optional[List[MessageHistory]] = []
     slot_state: Optional[dict] = {}
 
-@router.post("/ask", response_model=AnswerResponse)
-def ask_question(req: QuestionRequest):
-    logs = []
+@router.get("/ask/cache/stats")
+def get_answer_cache_stats():
+    return {
+        "answers": cache_stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "embeddings": embedding_cache.stats(),
+        "classifier": request_classifier.stats(),
+        "llm": llm_client.stats(),
+        "router": source_router.stats() if source_router is not None else None,
+        "reranker": reranker.stats() if reranker is not None else None,
+    }
+
+
+async def _no_emit(event: str, data=None):
+    pass
+
+
+async def _run_pipeline(req: QuestionRequest, logs: List[str], emit=_no_emit):
+    """
+    Clarification, sélection des sources, récupération et génération de la réponse brute.
+    `emit(event, data)` est appelé à chaque étape (utilisé par /ask/stream).
+    Retourne un dict : documents, slot_values, answer, final (réponse déjà reformulée,
+    issue du cache sémantique), styled (réponse rédigée directement dans le style final,
+    mode "single"), streamed (réponse déjà émise en événements "token"), error (message
+    d'erreur à la place de la réponse, à ne pas mémoriser) et semantic (clé à utiliser
+    pour mémoriser la réponse finale).
+
+    ASK_PIPELINE_MODE="single" : clarification et sélection des sources en un seul appel
+    (services/planner.py), réponse générée directement dans le style final ;
+    "multi" : chaîne d'appels d'origine (clarification, sources, réponse, reformulation).
+    """
     original_question = req.question
     combined_docs = []
-    context_messages = []
     slot_state = req.slot_state or {}
+    single_pass = ASK_PIPELINE_MODE == "single"
     
     # --- Historique et clarification ---
-    if req.chatbot_id and req.history:
-        max_ctx = get_memoire_contextuelle(req.chatbot_id)
-        context_messages = req.history[-max_ctx:]
+    async def context_history():
+        context_messages = []
+        if req.chatbot_id and req.history:
+            max_ctx = (await get_chatbot_config(req.chatbot_id)).memoire_contextuelle
+            context_messages = req.history[-max_ctx:]
+        return [{"role": m.role, "content": m.content} for m in context_messages]
+
+    def is_request():
+        probability = request_classifier.request_probability(original_question)
+        logs.append(f"Probabilité de demande : {probability:.2f}")
+        return probability >= request_classifier.threshold
+
+    async def clarify():
+        history = await context_history()
+
+        # Message non classé comme demande : pas de clarification
+        if not is_request():
+            logs.append("Requête non considérée comme demande, pas besoin de clarification")
+            return None
+
+        if not needs_coreference(history, original_question):
+            logs.append("Aucune référence à résoudre (historique vide ou sans pronom), pas d'appel LLM")
+            return None
+        return await clarify_question(history=history, question=original_question)
+
+    async def plan():
+        history = await context_history()
+        chatbot_config = await get_chatbot_config(req.chatbot_id)
+        request = is_request()
+        if not request:
+            logs.append("Requête non considérée comme demande, pas besoin de clarification")
+        elif not needs_coreference(history, original_question):
+            logs.append("Aucune référence à résoudre (historique vide ou sans pronom), pas de clarification")
+        planned = await plan_request(
+            history, original_question, chatbot_config.sources, clarify=request,
+            namespace=f"{req.chatbot_id}:{chatbot_config.version}",
+        )
+        logs.append(
+            "Clarification et sélection des sources : "
+            + ("un seul appel LLM" if planned["llm"] else "sans appel LLM")
+        )
+        return planned
+
     logs.append(f"🔍 Question originale : {original_question}")
-    
+
+    # La clarification (appel LLM) et le chargement de la configuration du chatbot sont indépendants
+    stage_results = await run_stages({
+        "clarification": clarify() if not single_pass else None,
+        "plan": plan() if single_pass else None,
+        "config": get_chatbot_config(req.chatbot_id),
+    }, logs)
+    chatbot_config = stage_results["config"]
+    chatbot_sources = chatbot_config.sources
+    planned = stage_results["plan"]
+
+    clarification = stage_results["clarification"]
+    if planned is not None and planned["question"] != original_question.strip():
+        clarification = planned["question"]
+
     clarified_question = original_question
-    if is_question_or_request(original_question):
-        clarified_question = clarify_question(
-            history=[{"role": m.role, "content": m.content} for m in context_messages],
-            question=original_question
-        )
+    if clarification is not None:
+        clarified_question = clarification
         logs.append(f"🔍 Question clarifiée : {clarified_question}")
     else:
-        logs.append("Requête non considérée comme demande, pas besoin de clarification")
+        logs.append("Question conservée telle quelle")
+    await emit("clarification", clarified_question)
+
+    # --- Cache sémantique : question proche déjà traitée pour ce chatbot ---
+    # (désactivé pour les chatbots à slots, dont la réponse dépend de l'état de la conversation)
+    # L'embedding de la question clarifiée est calculé une seule fois par requête,
+    # puis réutilisé par le cache sémantique et par toutes les collections Qdrant.
+    question_embedding = {}
+
+    async def embed_question():
+        if "vector" not in question_embedding:
+            embeddings = await get_embedding([clarified_question])
+            question_embedding["vector"] = embeddings[0] if embeddings is not None else None
+        return question_embedding["vector"]
+
+    semantic_key = None
+    # Réponses dépendant de données vivantes (templates PostgreSQL, résultats SQL, data_action_api
+    # via les slots) : jamais rejouées depuis le cache sémantique
+    semantic_cacheable = not (
+        chatbot_config.slots or chatbot_config.connexions or chatbot_config.postgres_connexions
+        or chatbot_config.connexion_info[1]
+    )
+    if semantic_cache is not None and req.chatbot_id and semantic_cacheable:
+        question_vector = await embed_question()
+        if question_vector is not None:
+            namespace = f"{req.chatbot_id}:{chatbot_config.version}"
+            hit = semantic_cache.lookup(namespace, question_vector, clarified_question)
+            if hit:
+                logs.append(f"Utilisation du cache sémantique (similarité {hit['score']:.3f}) : {hit['question']}")
+                return {
+                    "documents": hit["documents"],
+                    "slot_values": slot_state,
+                    "answer": hit["answer"],
+                    "final": True,
+                    "styled": False,
+                    "streamed": False,
+                    "error": False,
+                    "semantic": None,
+                }
+            semantic_key = (namespace, question_vector, clarified_question)
     
-    # --- Récupération des sources pertinentes ---
-    relevant_sources = ask_mixtral_for_relevant_sources(req.chatbot_id, clarified_question)
+    # --- Récupération des sources pertinentes (déjà choisies par le plan en mode "single") ---
+    if planned is not None:
+        relevant_sources = planned["sources"]
+    else:
+        relevant_sources = await ask_mixtral_for_relevant_sources(
+            req.chatbot_id, clarified_question, chatbot_sources
+        )
     if not relevant_sources:
         logs.append("Aucune source sélectionnée.")
     else:
@@ -91,57 +226,121 @@ def ask_question(req: QuestionRequest):
                 connexions_to_use.append(src.get("name"))
             elif typ == "slot":
                 slots_to_use.append(src.get("name"))
+    await emit("sources", [
+        {"type": src.get("type"), "name": src.get("name")}
+        for src in relevant_sources if isinstance(src, dict)
+    ])
     
-    # --- Récupération documents ---
-    if documents_to_use:
-        text_docs = retrieve_documents(
-            client, COLLECTION_NAME, clarified_question, k=10, document_filter=documents_to_use
+    # --- Récupération documents, connexions et slots (branches indépendantes, en parallèle) ---
+    columns_to_extract = [
+        s["columns"] for s in chatbot_sources["slots"] if s["slot_name"] in slots_to_use
+    ]
+    # Avec reclassement, plus de candidats sont récupérés puis seuls les meilleurs sont gardés.
+    # Pas pour les connexions : chaque template est rendu (requête SQL distante) avant le reclassement
+    k = RERANK_CANDIDATES if reranker is not None else 10
+    k_connexions = 10
+
+    async def search():
+        question_vector = await embed_question()
+        if question_vector is None:
+            logs.append("⚠️ Embedding indisponible, aucun document récupéré.")
+            return [], []
+        if not lexical_sources(documents_to_use):
+            return await search_collections(client, question_vector, [
+                {"collection_name": COLLECTION_NAME, "document_filter": documents_to_use, "k": k},
+                {"collection_name": POSTGRESS_COLLECTION_NAME, "document_filter": connexions_to_use, "k": k_connexions},
+            ], chatbot_config.postgres_connexions)
+
+        # Sources aussi indexées en plein texte : moins de documents, mieux classés (RRF)
+        text_docs, (connexion_docs,) = await asyncio.gather(
+            hybrid_search(
+                client, clarified_question, question_vector, documents_to_use,
+                k=k if reranker is not None else HYBRID_TOP_K,
+                postgres_connexions=chatbot_config.postgres_connexions, logs=logs,
+            ),
+            search_collections(client, question_vector, [
+                {"collection_name": POSTGRESS_COLLECTION_NAME, "document_filter": connexions_to_use, "k": k_connexions},
+            ], chatbot_config.postgres_connexions),
         )
+        return text_docs, connexion_docs
+
+    async def retrieve():
+        text_docs, connexion_docs = await search()
+        if reranker is None or not (text_docs or connexion_docs):
+            return text_docs, connexion_docs
+        reranked = await reranker.rerank_many(clarified_question, [text_docs, connexion_docs])
+        logs.append(
+            f"Reclassement : {len(text_docs) + len(connexion_docs)} candidats"
+            f" -> {sum(len(docs) for docs in reranked)} documents"
+        )
+        return reranked[0], reranked[1]
+
+    branches = await run_stages({
+        "documents": retrieve() if documents_to_use or connexions_to_use else None,
+        "slot_values": extract_slots_with_llm(
+            clarified_question, columns_to_extract, slot_state, req.chatbot_id
+        ) if columns_to_extract else None,
+    }, logs)
+
+    text_docs, connexion_docs = branches["documents"] or ([], [])
+    if documents_to_use:
         combined_docs.extend(text_docs)
         logs.append(f"Documents textes : {text_docs}")
-        
+
     if connexions_to_use:
-        connexion_docs = retrieve_documents(
-            client, POSTGRESS_COLLECTION_NAME, clarified_question, k=10, document_filter=connexions_to_use
-        )
         combined_docs.extend(connexion_docs)
         logs.append("Documents PostgreSQL : " + json.dumps(connexion_docs, ensure_ascii=False, indent=2))
-    
-    # --- Récupération slots ---
+
     slot_values = slot_state or {}
-    if slots_to_use:
-        all_slots = get_slots_for_chatbot(req.chatbot_id)
-        columns_to_extract = [s["columns"] for s in all_slots if s["slot_name"] in slots_to_use]
-        if columns_to_extract:
-            slot_values = extract_slots_with_llm(
-                clarified_question, columns_to_extract, slot_state, req.chatbot_id
-            )
-            logs.append("Valeurs extraites des slots : " + json.dumps(slot_values, ensure_ascii=False))
+    if branches["slot_values"] is not None:
+        slot_values = branches["slot_values"]
+        logs.append("Valeurs extraites des slots : " + json.dumps(slot_values, ensure_ascii=False))
     
     # --- Ajouter data_api_list de data_action_api dans combined_docs si existant ---
-    if slot_values.get("data_action_api") and "data_api_list" in slot_values["data_action_api"]:
+    has_data_api = bool(slot_values.get("data_action_api") and "data_api_list" in slot_values["data_action_api"])
+    if has_data_api:
+        # Toujours inclus dans le contexte, quel que soit le score des documents récupérés
         combined_docs.append({
-            "text": json.dumps(slot_values["data_action_api"]["data_api_list"], ensure_ascii=False, indent=2)
+            "text": format_rows(slot_values["data_action_api"]["data_api_list"]),
+            "pinned": True,
         })
         logs.append(f"✅ data_api_list ajoutés dans combined_docs : {len(slot_values['data_action_api']['data_api_list'])}")
     
     docs_text_only = [doc["text"] for doc in combined_docs]
+    await emit("documents", docs_text_only)
     
     # --- Générer la réponse ---
-    resp = generate_answer(clarified_question, combined_docs, req.chatbot_id)
+    # En mode "single" et sans data_action_api, la réponse générée est la réponse finale :
+    # ses fragments sont émis en "token" ; sinon ce n'est qu'un brouillon ("draft")
+    answer_is_final = single_pass and not has_data_api
+    streamed = []
+
+    async def on_answer_token(token):
+        if answer_is_final:
+            streamed.append(token)
+        await emit("token" if answer_is_final else "draft", token)
+
+    resp = await generate_answer(
+        clarified_question, combined_docs, req.chatbot_id,
+        on_token=on_answer_token if emit is not _no_emit else None,
+        final_style=single_pass,
+    )
     answer_llm = resp.get("answer", "")
     logs.extend(resp.get("logs", []))
     
     # --- Construction de la réponse finale ---
     answer_final = ""
+    styled = answer_is_final
+    error = bool(resp.get("error"))
 
-    if slot_values.get("data_action_api") and "data_api_list" in slot_values["data_action_api"]:
+    if has_data_api:
         try:
             data_list = slot_values["data_action_api"]["data_api_list"]
 
             if data_list:
                 # ✅ On garde le JSON brut pour reformulation par le LLM ensuite
                 answer_final = json.dumps(data_list, ensure_ascii=False, indent=2)
+                error = False
             else:
                 # ⚠️ Aucune donnée trouvée : on génère une réponse polie via LLM
                 llm_prompt_empty = [
@@ -159,8 +358,10 @@ def ask_question(req: QuestionRequest):
                         "content": f"Question utilisateur : {original_question}\nAucune donnée trouvée dans l'API."
                     }
                 ]
+                # Réponse polie déjà finale en mode "single" (pas de reformulation)
+                styled, error = single_pass, False
                 try:
-                    answer_final = call_llm("mixtral", llm_prompt_empty).strip()
+                    answer_final = (await call_llm("mixtral", llm_prompt_empty)).strip()
                 except Exception as e:
                     logs.append(f"⚠️ Erreur LLM pour réponse vide : {e}")
                     answer_final = "Aucune réponse disponible pour cette question."
@@ -171,35 +372,67 @@ def ask_question(req: QuestionRequest):
     else:
         answer_final = answer_llm or "Aucune réponse disponible."
 
+    return {
+        "documents": docs_text_only,
+        "slot_values": slot_values,
+        "answer": answer_final,
+        "final": False,
+        "styled": styled,
+        "streamed": bool(streamed),
+        "error": error,
+        "semantic": semantic_key if not slots_to_use else None,
+    }
+
+
+def _remember_answer(result: dict, answer: str):
+    """Mémorise la réponse finale dans le cache sémantique (jamais un message d'erreur)."""
+    if result["semantic"] is not None and answer and not result.get("error"):
+        namespace, vector, question = result["semantic"]
+        semantic_cache.add(namespace, vector, question, answer, result["documents"])
+
+
+def _build_clarify_prompt(answer_final: str):
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Tu es un assistant expert en reformulation claire et pédagogique. "
+                "Ta tâche est d'améliorer la compréhension du texte fourni en le réécrivant en français naturel et fluide.\n\n"
+                + CONSIGNES_STYLE_FINAL
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"{answer_final}"
+        }
+    ]
+
+
+@router.post("/ask", response_model=AnswerResponse)
+async def ask_question(req: QuestionRequest):
+    logs = []
+    try:
+        result = await _run_pipeline(req, logs)
+    except LLMError as e:
+        # Fournisseur LLM lent ou en panne : erreur explicite plutôt qu'une 500
+        raise HTTPException(status_code=503, detail=f"Service LLM indisponible : {e}")
+    docs_text_only, slot_values, answer_final = result["documents"], result["slot_values"], result["answer"]
+
     # --- Clarification avec LLM pour rendre la réponse fluide ---
     clair_answer_final = ""
 
-    if answer_final:
-        clarify_prompt = [
-            {
-                "role": "system",
-                "content": (
-                    "Tu es un assistant expert en reformulation claire et pédagogique. "
-                    "Ta tâche est d'améliorer la compréhension du texte fourni en le réécrivant en français naturel et fluide.\n\n"
-                    "Règles à suivre :\n"
-                    "1. N'ajoute aucune information nouvelle et ne modifie pas le sens du texte.\n"
-                    "2. Organise le texte avec des paragraphes clairs et des titres ou expressions importantes en **gras**.\n"
-                    "3. Explique ou reformule les passages techniques si nécessaire, sans trahir le contenu.\n"
-                    "4. Évite tout ton robotique ou académique excessif — le texte doit être lisible et humain.\n"
-                    "5. Écris uniquement en français, sans anglais ni caractères techniques (JSON, crochets, guillemets inutiles, etc.).\n"
-                    "6. Si le texte contient plusieurs articles, sépare-les proprement avec des sous-titres explicites.\n"
-                    "7. Ne traduis pas les termes juridiques ou noms d’articles du Code civil."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"{answer_final}"
-            }
-        ]
+    if result["final"]:
+        clair_answer_final = answer_final
+    elif result["styled"]:
+        # Mode "single" : réponse déjà rédigée dans le style final, pas de reformulation
+        clair_answer_final = answer_final
+        _remember_answer(result, clair_answer_final)
+    elif answer_final:
         try:
             # clair_answer_final = call_llm("mixtral", clarify_prompt).strip()
-            clair_answer_final = call_llm("mixtral", clarify_prompt).strip()
+            clair_answer_final = (await call_llm("mixtral", _build_clarify_prompt(answer_final))).strip()
             print("🪄 Réponse clarifiée :", clair_answer_final)
+            _remember_answer(result, clair_answer_final)
         except Exception as e:
             logs.append(f"⚠️ Erreur lors de la clarification via LLM : {e}")
             clair_answer_final = answer_final
@@ -212,4 +445,78 @@ def ask_question(req: QuestionRequest):
         answer=clair_answer_final,  # ✅ On renvoie la version clarifiée finale
         logs=logs,
         slot_state=slot_values
-    )
\ No newline at end of file
+    )
+
+@router.post("/ask/stream")
+async def ask_question_stream(req: QuestionRequest):
+    """
+    Variante streamée de /ask (NDJSON, un événement JSON par ligne) :
+      - {"event": "clarification", "data": "<question clarifiée>"}
+      - {"event": "sources", "data": [{"type": ..., "name": ...}]}
+      - {"event": "documents", "data": ["<texte>", ...]}
+      - {"event": "draft", "data": "<token>"}   réponse brute (hors raisonnement SQL ; mode "multi" ou data_action_api)
+      - {"event": "token", "data": "<token>"}   réponse finale (reformulation, ou réponse directe en mode "single")
+      - {"event": "done", "data": AnswerResponse}  réponse complète, qui fait foi
+      - {"event": "error", "data": "<message>"}
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, data=None):
+        await queue.put({"event": event, "data": data})
+
+    async def run():
+        logs = []
+        try:
+            result = await _run_pipeline(req, logs, emit)
+            docs_text_only, slot_values, answer_final = result["documents"], result["slot_values"], result["answer"]
+
+            if result["final"]:
+                clair_answer_final = answer_final
+                await emit("token", clair_answer_final)
+            elif result["styled"]:
+                clair_answer_final = answer_final
+                if not result["streamed"]:
+                    await emit("token", clair_answer_final)
+                _remember_answer(result, clair_answer_final)
+            elif answer_final:
+                tokens = []
+                try:
+                    async for token in stream_llm("mixtral", _build_clarify_prompt(answer_final)):
+                        tokens.append(token)
+                        await emit("token", token)
+                    clair_answer_final = "".join(tokens).strip()
+                    _remember_answer(result, clair_answer_final)
+                except Exception as e:
+                    logs.append(f"⚠️ Erreur lors de la clarification via LLM : {e}")
+                    clair_answer_final = answer_final
+                    if not tokens:
+                        await emit("token", answer_final)
+            else:
+                clair_answer_final = "Aucune réponse disponible pour cette question."
+                await emit("token", clair_answer_final)
+
+            await emit("done", jsonable_encoder(AnswerResponse(
+                documents=docs_text_only,
+                answer=clair_answer_final,
+                logs=logs,
+                slot_state=slot_values
+            )))
+        except Exception as e:
+            print(f"[Erreur /ask/stream] : {e}")
+            await emit("error", str(e))
+        finally:
+            await queue.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # Client déconnecté : inutile de poursuivre le pipeline
+            task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
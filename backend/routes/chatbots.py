@@ -0,0 +1,16 @@
+# routes/chatbots.py
+from fastapi import APIRouter
+from services.chatbot_config import invalidate_chatbot_config
+
+router = APIRouter(prefix="/chatbots", tags=["Chatbots"])
+
+
+# --- Invalidation du cache de configuration (après modification dans Supabase) ---
+@router.post("/cache/invalidate")
+def invalidate_all_configs():
+    return {"invalidated": invalidate_chatbot_config()}
+
+
+@router.post("/{chatbot_id}/cache/invalidate")
+def invalidate_config(chatbot_id: str):
+    return {"chatbot_id": chatbot_id, "invalidated": invalidate_chatbot_config(chatbot_id)}
@@ -0,0 +1,41 @@
+from typing import List, Optional
+
+# Extraits mis en évidence renvoyés par ts_headline
+HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<b>, StopSel=</b>"
+
+
+def fulltext_search(cur, q: str, limit: int, categories: Optional[List[str]] = None) -> List[dict]:
+    """
+    Recherche des articles par mots-clés dans la table `articles`, classés par pertinence.
+    1️⃣ plein texte sur search_vector (GIN, numéro/titre pondérés avant le contenu),
+       extraits calculés sur la page seulement ;
+    2️⃣ si aucun résultat, recherche floue par trigrammes (GIN pg_trgm).
+    `categories` restreint aux articles d'au moins une de ces catégories.
+    """
+    category_filter = "AND string_to_array(categories, ',') && %s::text[]" if categories else ""
+    category_params = (categories,) if categories else ()
+
+    cur.execute(f"""
+        SELECT numero, contenu, score, ts_headline('french', contenu, query, %s)
+        FROM (
+            SELECT numero, contenu, numero_tri, query, ts_rank_cd(search_vector, query) AS score
+            FROM articles, websearch_to_tsquery('french', %s) AS query
+            WHERE search_vector @@ query {category_filter}
+            ORDER BY score DESC, numero_tri
+            LIMIT %s
+        ) AS best
+        ORDER BY score DESC, numero_tri;
+    """, (HEADLINE_OPTIONS, q, *category_params, limit))
+    rows = cur.fetchall()
+
+    if not rows:
+        cur.execute(f"""
+            SELECT numero, contenu, word_similarity(%s, contenu) AS score, NULL
+            FROM articles
+            WHERE %s <%% contenu {category_filter}
+            ORDER BY score DESC, numero_tri
+            LIMIT %s;
+        """, (q, q, *category_params, limit))
+        rows = cur.fetchall()
+
+    return [{"numero": r[0], "contenu": r[1], "score": r[2], "extrait": r[3]} for r in rows]
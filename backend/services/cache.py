@@ -1,11 +1,280 @@
-import json
-_cache = {}
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    ANSWER_CACHE_BACKEND,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MAX_BYTES,
+    ANSWER_CACHE_SQLITE_PATH,
+    REDIS_URL,
+)
 
 
-def get_cache(query, docs):
-    key = (query, json.dumps(docs, sort_keys=True))
-    return _cache.get(key)
+class TTLCache:
+    """
+    Cache mémoire borné : éviction LRU au-delà de `maxsize` entrées (et de
+    `max_bytes` si une taille est fournie à set), expiration après `ttl` secondes.
+    Tient des compteurs hits / misses / évictions.
+    """
 
-def set_cache(query, docs, result):
-    key = (query, json.dumps(docs, sort_keys=True))
-    _cache[key] = result
\ No newline at end of file
+    def __init__(self, maxsize: int = 256, ttl: float = 300, max_bytes: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, size, value = item
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size: int = 0):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes and self.bytes > self.max_bytes and len(self._data) > 1
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key):
+        _, size, value = self._data.pop(key)
+        self.bytes -= size
+        return value
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Cache partagé entre plusieurs workers uvicorn via un fichier SQLite (mode WAL).
+    Même interface que TTLCache ; l'éviction LRU se fait sur la date du dernier accès.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 3600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, key, value, size: int = 0):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+            (key, value, now + self.ttl, now, size),
+        )
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        removed = conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        ).rowcount
+        self.evictions += max(removed, 0)
+
+    def pop(self, key, default=None):
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return default if row is None else row[0]
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RedisCache:
+    """
+    Cache partagé via Redis (ou un serveur compatible : KeyDB, Valkey, Dragonfly...).
+    L'éviction LRU est déléguée au serveur (maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, url: str, ttl: float = 3600, prefix: str = "answer:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, size: int = 0):
+        self.client.set(self.prefix + key, value, ex=int(self.ttl))
+
+    def pop(self, key, default=None):
+        value = self.client.getdel(self.prefix + key)
+        return default if value is None else value
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _build_answer_cache():
+    if ANSWER_CACHE_BACKEND == "redis" and REDIS_URL:
+        try:
+            return RedisCache(REDIS_URL, ttl=ANSWER_CACHE_TTL)
+        except Exception as e:
+            print(f"⚠️ Cache Redis indisponible, repli sur le cache mémoire : {e}")
+    elif ANSWER_CACHE_BACKEND == "sqlite":
+        try:
+            return SQLiteCache(
+                ANSWER_CACHE_SQLITE_PATH,
+                maxsize=ANSWER_CACHE_MAX_ENTRIES,
+                ttl=ANSWER_CACHE_TTL,
+            )
+        except Exception as e:
+            print(f"⚠️ Cache SQLite indisponible, repli sur le cache mémoire : {e}")
+    return TTLCache(
+        maxsize=ANSWER_CACHE_MAX_ENTRIES,
+        ttl=ANSWER_CACHE_TTL,
+        max_bytes=ANSWER_CACHE_MAX_BYTES,
+    )
+
+
+_cache = _build_answer_cache()
+
+
+def make_cache_key(query, docs, namespace=None) -> str:
+    """
+    Clé compacte (SHA-256) pour une question, un contexte documentaire et un chatbot.
+    """
+    h = hashlib.sha256()
+    h.update(str(namespace or "").encode("utf-8"))
+    h.update(b"\x1e")
+    h.update(query.encode("utf-8"))
+    for doc in docs:
+        h.update(b"\x1e")
+        for k in sorted(doc):
+            # Le score de recherche varie sans changer le contenu
+            if k == "score":
+                continue
+            h.update(f"{k}\x1f{doc[k]}\x1f".encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_cache(query, docs, namespace=None, key=None):
+    key = key or make_cache_key(query, docs, namespace)
+    try:
+        return _cache.get(key)
+    except Exception as e:
+        print(f"⚠️ Erreur lecture cache : {e}")
+        return None
+
+def set_cache(query, docs, result, namespace=None, key=None):
+    key = key or make_cache_key(query, docs, namespace)
+    try:
+        _cache.set(key, result, size=len(key) + len(result.encode("utf-8")))
+    except Exception as e:
+        print(f"⚠️ Erreur écriture cache : {e}")
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from config import supabase, CHATBOT_CONFIG_TTL, CHATBOT_CONFIG_MAXSIZE
+from utils.helpers import slots_from_associations, possible_values_from_associations
+from .cache import TTLCache
+from .stages import run_stages
+from .semantic_cache import semantic_cache
+
+
+@dataclass
+class ChatbotConfig:
+    """
+    Configuration d'un chatbot (description, mémoire, sources, slots, connexions...)
+    chargée en une fois depuis Supabase puis servie depuis le cache.
+    """
+
+    chatbot_id: Optional[str]
+    description: str = ""
+    memoire_contextuelle: int = 0
+    connexions: List[dict] = field(default_factory=list)
+    documents: List[dict] = field(default_factory=list)
+    slots: List[dict] = field(default_factory=list)
+    possible_values: List[str] = field(default_factory=list)
+    slot_events: List[dict] = field(default_factory=list)
+    web_action_urls: List[dict] = field(default_factory=list)
+    postgres_connexions: Dict[str, dict] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+    version: str = ""
+
+    @property
+    def sources(self) -> Dict[str, List[dict]]:
+        """Même forme que load_chatbot_sources (connexions, documents, slots)."""
+        return {
+            "connexions": self.connexions,
+            "documents": self.documents,
+            "slots": self.slots,
+        }
+
+    @property
+    def connexion_info(self):
+        """Équivalent de get_connexion_info : (nom, sql_reasoning, schéma, paramètres)."""
+        # get_connexion_info utilisait .single() : une seule connexion attendue
+        if len(self.connexions) != 1:
+            return "", False, "", {}
+        name = self.connexions[0].get("connexion_name") or ""
+        enabled = bool(self.connexions[0].get("sql_reasoning", False))
+        schema, params = "", {}
+        if enabled:
+            params = self.postgres_connexions.get(name)
+            if not params:
+                return "", False, "", {}
+            schema = (params.get("data_schema") or "").strip()
+        return name, enabled, schema, params
+
+    @property
+    def web_action_url(self) -> Optional[str]:
+        """Équivalent de process_chatbot_web_actions : première URL de web action."""
+        if not self.slot_events or not self.web_action_urls:
+            return None
+        return self.web_action_urls[0]["url"]
+
+
+_configs = TTLCache(maxsize=CHATBOT_CONFIG_MAXSIZE, ttl=CHATBOT_CONFIG_TTL)
+_loading: Dict[str, asyncio.Future] = {}
+
+
+def _rows(query) -> List[dict]:
+    return query.execute().data or []
+
+
+def _fetch(query):
+    return run_in_threadpool(_rows, query)
+
+
+async def _load_chatbot_config(chatbot_id: str) -> ChatbotConfig:
+    # 1️⃣ Tables directement rattachées au chatbot
+    first = await run_stages({
+        "chatbot": _fetch(
+            supabase.table("chatbots")
+            .select("description, memoire_contextuelle")
+            .eq("id", chatbot_id)
+        ),
+        "connexions": _fetch(
+            supabase.table("chatbot_pgsql_connexions")
+            .select("connexion_name, description, sql_reasoning")
+            .eq("chatbot_id", chatbot_id)
+        ),
+        "documents": _fetch(
+            supabase.table("chatbot_document_association")
+            .select("document_name, description")
+            .eq("chatbot_id", chatbot_id)
+        ),
+        "slot_associations": _fetch(
+            supabase.from_("chatbot_slot_associations")
+            .select("*, slots(*)")
+            .eq("chatbot_id", chatbot_id)
+        ),
+    })
+    chatbot = first["chatbot"][0] if first["chatbot"] else {}
+    slots = slots_from_associations(first["slot_associations"])
+    connexion_names = [c["connexion_name"] for c in first["connexions"] if c.get("connexion_name")]
+    slot_ids = [s["slot_id"] for s in slots]
+
+    # 2️⃣ Tables qui dépendent des connexions / slots
+    second = await run_stages({
+        "postgres_connexions": _fetch(
+            supabase.table("postgresql_connexions")
+            .select("connexion_name, postgres_service_url, data_schema, host_name, port, user, password, database, ssl_mode")
+            .in_("connexion_name", connexion_names)
+        ) if connexion_names else None,
+        "slot_events": _fetch(
+            supabase.from_("slot_events").select("*").in_("slot_id", slot_ids)
+        ) if slot_ids else None,
+    })
+    slot_events = [
+        {
+            "event_id": event.get("id"),
+            "slot_id": event.get("slot_id"),
+            "event_name": event.get("event"),
+            "action_id": event.get("action_id"),
+            "created_at": event.get("created_at"),
+        }
+        for event in second["slot_events"] or []
+    ]
+
+    # 3️⃣ Web actions associées aux événements
+    web_action_urls = []
+    action_ids = list({e["action_id"] for e in slot_events if e["action_id"]})
+    if action_ids:
+        actions = await _fetch(supabase.from_("web_actions").select("*").in_("id", action_ids))
+        actions_by_id = {a.get("id"): a for a in actions}
+        for event in slot_events:
+            action = actions_by_id.get(event["action_id"])
+            if action and action.get("url"):
+                web_action_urls.append({"event_name": event["event_name"], "url": action["url"]})
+
+    cfg = ChatbotConfig(
+        chatbot_id=chatbot_id,
+        description=(chatbot.get("description") or "").strip(),
+        memoire_contextuelle=int(chatbot.get("memoire_contextuelle") or 0),
+        connexions=first["connexions"],
+        documents=first["documents"],
+        slots=slots,
+        possible_values=possible_values_from_associations(first["slot_associations"]),
+        slot_events=slot_events,
+        web_action_urls=web_action_urls,
+        postgres_connexions={r["connexion_name"]: r for r in second["postgres_connexions"] or []},
+    )
+    cfg.version = hashlib.sha1(
+        json.dumps(
+            [cfg.description, cfg.connexions, cfg.documents, cfg.slots],
+            sort_keys=True, ensure_ascii=False, default=str,
+        ).encode("utf-8")
+    ).hexdigest()[:12]
+    return cfg
+
+
+async def get_chatbot_config(chatbot_id: Optional[str]) -> ChatbotConfig:
+    """
+    Retourne la configuration du chatbot depuis le cache (TTL + LRU).
+    En cas d'absence, un seul chargement est lancé même si plusieurs requêtes
+    concurrentes demandent le même chatbot.
+    """
+    if not chatbot_id:
+        return ChatbotConfig(chatbot_id=None)
+
+    cfg = _configs.get(chatbot_id)
+    if cfg is not None:
+        return cfg
+
+    future = _loading.get(chatbot_id)
+    if future is None:
+        future = asyncio.ensure_future(_load_and_store(chatbot_id))
+        _loading[chatbot_id] = future
+        future.add_done_callback(lambda _: _loading.pop(chatbot_id, None))
+    return await asyncio.shield(future)
+
+
+async def _load_and_store(chatbot_id: str) -> ChatbotConfig:
+    try:
+        cfg = await _load_chatbot_config(chatbot_id)
+    except Exception as e:
+        print(f"[Erreur chargement configuration chatbot {chatbot_id}] : {e}")
+        raise
+    _configs.set(chatbot_id, cfg)
+    return cfg
+
+
+def invalidate_chatbot_config(chatbot_id: Optional[str] = None) -> int:
+    """
+    Invalide la configuration d'un chatbot (ou de tous si chatbot_id est None).
+    Retourne le nombre d'entrées supprimées.
+    """
+    if semantic_cache is not None:
+        semantic_cache.clear(f"{chatbot_id}:" if chatbot_id else "")
+    if chatbot_id is None:
+        count = len(_configs)
+        _configs.clear()
+        return count
+    return 0 if _configs.pop(chatbot_id) is None else 1
@@ -1,7 +1,91 @@
+import hashlib
+import json
+import re
 from typing import List
+from config import CLARIFY_CACHE_TTL, CLARIFY_CACHE_MAX_ENTRIES
 from services.mixtral import call_llm, is_question_or_request
+from services.cache import TTLCache
+
+# Noms fréquents en -er / -ir / -re, qui suivent "le / la / les" comme articles et non comme pronoms
+NOMS_EN_ER_IR_RE = (
+    "titre", "livre", "chapitre", "ordre", "nombre", "membre", "lettre", "registre",
+    "meurtre", "ministre", "centre", "barre", "guerre", "terre", "mer", "père", "mère", "frère",
+    "premier", "première", "dernier", "dernière", "dossier", "casier", "greffier", "huissier",
+    "métier", "loyer", "foyer", "cancer", "hiver", "pouvoir", "devoir", "avoir", "savoir", "avenir",
+    "désir", "plaisir", "loisir", "notaire", "salaire", "propriétaire", "locataire", "bénéficiaire",
+    "commissaire", "mandataire", "procédure", "mesure", "nature", "signature", "voiture",
+    "cadre", "offre", "chiffre", "heure", "demeure", "mineure", "majeure",
+)
+
+# Pronoms et expressions qui renvoient à un élément de la conversation.
+# "le / la / les / l'" ne comptent que comme pronoms compléments (après un sujet,
+# "ne", devant un infinitif ou en fin d'impératif), pas comme articles.
+ANAPHORE_PATTERN = re.compile(
+    r"\b(?:"
+    r"il|elle|ils|elles|lui|leur|leurs|eux"
+    r"|cela|ça|ceci|celui|celle|ceux|celles"
+    r"|ce(?:tte|s|t)?(?:\s+(?:dernier|derni[èe]re|derniers|derni[èe]res))?"
+    r"|son|sa|ses"
+    r"|(?:le|la|les)\s+m[êe]mes?"
+    r"|(?:je|tu|on|nous|vous|ne|il|elle|ils|elles)\s+(?:(?:me|te|se|nous|vous)\s+)?(?:le|la|les|l['’]|y|en)"
+    # "le / la / les / l'" + infinitif après n'importe quel mot : "comment le calculer", "où la trouver"
+    r"|(?<=\w\s)(?:le|la|les|l['’])\s*(?!(?:" + "|".join(NOMS_EN_ER_IR_RE) + r")s?\b)"
+    r"[a-zàâçéèêëîïôûù]+(?:er|ir|re)\b"
+    r"|(?:le|la|les|l['’])\s*(?:suivant|précédent)e?s?"
+    r"|qu['’]en"
+    r"|[a-zé]+-(?:le|la|les|lui|leur)"
+    r"|là-dessus|dedans|dessus"
+    r")\b",
+    re.IGNORECASE,
+)
+# Tournures figées où "il" / "ce" ne désignent rien
+IMPERSONNEL_PATTERN = re.compile(
+    r"\b(?:il\s+(?:y\s+a|faut|s['’]agit|existe|est\s+(?:possible|interdit|permis|obligatoire|nécessaire))"
+    r"|est-il\s+(?:possible|interdit|permis|obligatoire|nécessaire)|y\s+a-t-il|faut-il"
+    r"|est-ce|ce\s+(?:que|qui|qu['’]))\b",
+    re.IGNORECASE,
+)
+
+# Relances elliptiques, qui complètent la question précédente :
+# "Et le suivant ?", "Et pour un mineur ?", "Pour une personne morale ?", "Avec récidive ?"
+ELLIPSE_PATTERN = re.compile(
+    r"^\s*(?:et|ou|mais|sinon|aussi|idem|pareil)\b"
+    r"|^\s*(?:pour|avec|sans|dans|en|sur|concernant|quant\s+[àa])\b(?:\W+\w+){0,5}\W*$",
+    re.IGNORECASE,
+)
+
+# Clarifications déjà calculées, par (historique, question)
+_clarifications = TTLCache(maxsize=CLARIFY_CACHE_MAX_ENTRIES, ttl=CLARIFY_CACHE_TTL)
+
+
+def needs_coreference(history: List[dict], question: str) -> bool:
+    """
+    Pré-vérification locale : sans historique, ou sans pronom, expression référentielle
+    ni relance elliptique dans la question, il n'y a rien à résoudre (pas d'appel LLM).
+    """
+    if not history:
+        return False
+    if ELLIPSE_PATTERN.search(question):
+        return True
+    return bool(ANAPHORE_PATTERN.search(IMPERSONNEL_PATTERN.sub(" ", question)))
+
+
+def _clarification_key(history: List[dict], question: str) -> str:
+    h = hashlib.sha256(json.dumps(history, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    h.update(b"\x1e")
+    h.update(question.strip().encode("utf-8"))
+    return h.hexdigest()
+
+
+async def clarify_question(history: List[dict], question: str) -> str:
+    if not needs_coreference(history, question):
+        return question.strip()
+
+    key = _clarification_key(history, question)
+    cached = _clarifications.get(key)
+    if cached is not None:
+        return cached
 
-def clarify_question(history: List[dict], question: str) -> str:
     formatted_history = ""
     for msg in history:
         role = "Utilisateur" if msg["role"] == "user" else "Assistant"
@@ -32,5 +116,6 @@ def clarify_question(history: List[dict], question: str) -> str:
         },
     ]
 
-    clarified = call_llm("mixtral", messages)
-    return clarified.strip()
\ No newline at end of file
+    clarified = (await call_llm("mixtral", messages)).strip()
+    _clarifications.set(key, clarified)
+    return clarified
\ No newline at end of file
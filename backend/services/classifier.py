@@ -0,0 +1,73 @@
+import threading
+from typing import List
+import joblib
+import numpy as np
+from config import (
+    CLASSIFIER_MODEL_PATH,
+    CLASSIFIER_VECTORIZER_PATH,
+    CLASSIFIER_REQUEST_THRESHOLD,
+    CLASSIFIER_CACHE_MAX_ENTRIES,
+)
+from .cache import TTLCache
+
+
+class RequestClassifier:
+    """
+    Classifieur question / demande (TF-IDF + régression logistique).
+    - les modèles sont chargés au premier appel, depuis le dossier du backend
+      (indépendamment du répertoire de lancement) ;
+    - les probabilités déjà calculées sont mémorisées : un même texte n'est
+      évalué qu'une fois, même s'il est classé à plusieurs étapes de /ask ;
+    - plusieurs textes sont évalués en un seul passage (predict_proba).
+    """
+
+    def __init__(self, model_path: str, vectorizer_path: str, threshold: float = 0.5, cache_size: int = 10000):
+        self.model_path = model_path
+        self.vectorizer_path = vectorizer_path
+        self.threshold = threshold
+        self._model = None
+        self._vectorizer = None
+        self._lock = threading.Lock()
+        # Pas d'expiration : la probabilité d'un texte ne change qu'avec le modèle
+        self._memo = TTLCache(maxsize=cache_size, ttl=float("inf"))
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                self._vectorizer = joblib.load(self.vectorizer_path)
+                self._model = joblib.load(self.model_path)
+        return self._model, self._vectorizer
+
+    def request_probabilities(self, texts: List[str]) -> np.ndarray:
+        """Probabilité, pour chaque texte, qu'il s'agisse d'une question ou d'une demande."""
+        probabilities = [self._memo.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, p in zip(texts, probabilities) if p is None))
+        if missing:
+            model, vectorizer = self._load()
+            positive = list(model.classes_).index(1) if 1 in model.classes_ else -1
+            computed = model.predict_proba(vectorizer.transform(missing))[:, positive]
+            by_text = dict(zip(missing, computed.tolist()))
+            for text, p in by_text.items():
+                self._memo.set(text, p)
+            probabilities = [p if p is not None else by_text[t] for t, p in zip(texts, probabilities)]
+        return np.asarray(probabilities, dtype=np.float32)
+
+    def request_probability(self, text: str) -> float:
+        return float(self.request_probabilities([text])[0])
+
+    def is_request(self, text: str) -> bool:
+        return self.request_probability(text) >= self.threshold
+
+    def predict(self, texts: List[str]) -> List[bool]:
+        return (self.request_probabilities(texts) >= self.threshold).tolist()
+
+    def stats(self) -> dict:
+        return {**self._memo.stats(), "loaded": self._model is not None}
+
+
+request_classifier = RequestClassifier(
+    CLASSIFIER_MODEL_PATH,
+    CLASSIFIER_VECTORIZER_PATH,
+    threshold=CLASSIFIER_REQUEST_THRESHOLD,
+    cache_size=CLASSIFIER_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from config import (
+    CONTEXT_TOKENIZER,
+    CONTEXT_WINDOWS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_SAFETY_MARGIN,
+    CONTEXT_MIN_DOC_TOKENS,
+    CONTEXT_DEDUP_MAX_DISTANCE,
+    CONTEXT_ROWS_MAX_TOKENS,
+)
+
+# Estimation utilisée si le tokenizer n'est pas disponible (texte français, tokenizer Mistral)
+CHARS_PER_TOKEN = 3.5
+DOC_SEPARATOR = "\n---\n"
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Comptage des tokens avec le tokenizer local du modèle (transformers), chargé au premier appel
+    depuis un fichier tokenizer.json ou un dépôt Hugging Face.
+    S'il ne peut pas être chargé (pas de réseau ni de cache local), une estimation
+    par nombre de caractères prend le relais.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tokenizer = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._tokenizer is None and not self._failed:
+            with self._lock:
+                if self._tokenizer is None and not self._failed:
+                    try:
+                        if os.path.isfile(self.name):
+                            from transformers import PreTrainedTokenizerFast
+
+                            self._tokenizer = PreTrainedTokenizerFast(tokenizer_file=self.name)
+                        else:
+                            from transformers import AutoTokenizer
+
+                            self._tokenizer = AutoTokenizer.from_pretrained(self.name)
+                    except Exception as e:
+                        print(f"⚠️ Tokenizer {self.name} indisponible, estimation des tokens par caractères : {e}")
+                        self._failed = True
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._load()
+        if tokenizer is None:
+            return int(len(text) / CHARS_PER_TOKEN) + 1
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Début de `text` limité à `max_tokens` tokens."""
+        if max_tokens <= 0:
+            return ""
+        tokenizer = self._load()
+        if tokenizer is None:
+            return text[: int(max_tokens * CHARS_PER_TOKEN)]
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return tokenizer.decode(ids[:max_tokens])
+
+
+token_counter = TokenCounter(CONTEXT_TOKENIZER)
+
+
+# --- Déduplication (SimHash 64 bits sur des 3-grammes de mots) ---
+
+def _normalize(text: str) -> List[str]:
+    return WORD_PATTERN.findall((text or "").lower())
+
+
+def simhash(text: str) -> int:
+    words = _normalize(text)
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))] if words else [""]
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles),
+        dtype=">u8",
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    # Bit à 1 si la majorité des 3-grammes l'ont à 1
+    signature = (bits.sum(axis=0) * 2 > len(shingles)).astype(np.uint8)
+    return int.from_bytes(np.packbits(signature).tobytes(), "big")
+
+
+def deduplicate(docs: List[dict], max_distance: int = CONTEXT_DEDUP_MAX_DISTANCE) -> Tuple[List[dict], int]:
+    """
+    Retire les documents identiques ou quasi identiques (distance de Hamming des SimHash
+    <= `max_distance`) ; le premier, le mieux classé, est conservé.
+    Retourne (documents conservés, nombre de doublons retirés).
+    """
+    kept, signatures, seen = [], [], set()
+    for doc in docs:
+        words = " ".join(_normalize(doc.get("text", "")))
+        if words in seen:
+            continue
+        signature = simhash(words)
+        if any(bin(signature ^ s).count("1") <= max_distance for s in signatures):
+            continue
+        seen.add(words)
+        signatures.append(signature)
+        kept.append(doc)
+    return kept, len(docs) - len(kept)
+
+
+# --- Résultats tabulaires (SQL, API) ---
+
+def format_rows(rows, max_tokens: int = CONTEXT_ROWS_MAX_TOKENS) -> str:
+    """
+    JSON des lignes d'un résultat (SQL, data_api_list) limité à `max_tokens` :
+    seules les premières lignes sont gardées, suivies du nombre de lignes omises.
+    """
+    text = json.dumps(rows, indent=2, ensure_ascii=False, default=str)
+    if not isinstance(rows, list) or token_counter.count(text) <= max_tokens:
+        return text
+
+    total = len(rows)
+    # Taille moyenne d'une ligne (compacte) pour estimer combien en garder, puis ajustement
+    row_tokens = max(token_counter.count(json.dumps(rows[:20], ensure_ascii=False, default=str)) / min(total, 20), 1)
+    kept = max(min(int(max_tokens / row_tokens), total), 1)
+    while True:
+        text = json.dumps(rows[:kept], ensure_ascii=False, default=str)
+        if kept == 1 or token_counter.count(text) <= max_tokens:
+            break
+        kept = max(int(kept * 0.8), 1)
+    if kept == 1 and token_counter.count(text) > max_tokens:
+        text = token_counter.truncate(text, max_tokens) + " …"
+    return f"{text}\n[{total - kept} ligne(s) supplémentaire(s) non affichée(s) sur {total}]"
+
+
+# --- Budget et assemblage du contexte ---
+
+def context_budget(model: str, *prompt_parts: str, max_tokens: int = 0) -> int:
+    """
+    Tokens disponibles pour le contexte documentaire : fenêtre du modèle moins le prompt
+    (consignes, question), la réponse attendue et une marge, plafonné à CONTEXT_MAX_TOKENS.
+    """
+    window = CONTEXT_WINDOWS.get(model, min(CONTEXT_WINDOWS.values(), default=CONTEXT_MAX_TOKENS))
+    used = sum(token_counter.count(part) for part in prompt_parts) + max_tokens + CONTEXT_SAFETY_MARGIN
+    return max(min(CONTEXT_MAX_TOKENS, window - used), 0)
+
+
+def format_document(doc: dict) -> str:
+    return f"{doc['text']}\n(Source: {doc.get('source', 'inconnu')})"
+
+
+def pack_documents(docs: List[dict], budget: Optional[int]) -> Tuple[List[str], dict]:
+    """
+    Sélectionne les documents qui tiennent dans `budget` tokens :
+    - les documents épinglés (`pinned` : résultat SQL, data_api_list, déjà limités par
+      format_rows) sont toujours inclus, en tête ;
+    - les autres sont classés par `score` décroissant (Qdrant, RRF ou reclassement),
+      doublons retirés, puis remplissage glouton de la place restante ; le premier
+      document écarté est ensuite tronqué à la place restante, s'il reste au moins
+      CONTEXT_MIN_DOC_TOKENS.
+    Retourne (blocs de texte formatés, statistiques).
+    """
+    pinned = [format_document(doc) for doc in docs if doc.get("pinned")]
+    # Tri stable : sans score, l'ordre de la liste est conservé
+    ranked = sorted((doc for doc in docs if not doc.get("pinned")), key=lambda doc: -(doc.get("score") or 0.0))
+    unique, duplicates = deduplicate(ranked)
+    stats = {"documents": len(docs), "duplicates": duplicates, "dropped": 0, "truncated": 0, "tokens": 0}
+    if budget is None:
+        blocks = pinned + [format_document(doc) for doc in unique]
+        stats["tokens"] = sum(token_counter.count(b) for b in blocks)
+        return blocks, stats
+
+    separator = token_counter.count(DOC_SEPARATOR)
+    pinned_tokens = sum(token_counter.count(block) + separator for block in pinned)
+    budget = max(budget - pinned_tokens, 0)
+    selected, skipped, remaining = {}, [], budget
+    for i, doc in enumerate(unique):
+        block = format_document(doc)
+        cost = token_counter.count(block) + separator
+        if cost <= remaining:
+            selected[i] = block
+            remaining -= cost
+        else:
+            skipped.append((i, block))
+
+    if skipped and remaining - separator >= CONTEXT_MIN_DOC_TOKENS:
+        i, block = skipped.pop(0)
+        selected[i] = token_counter.truncate(block, remaining - separator) + " …"
+        stats["truncated"] += 1
+        remaining = 0
+    stats["dropped"] = len(skipped)
+    stats["tokens"] = pinned_tokens + budget - remaining
+    return pinned + [selected[i] for i in sorted(selected)], stats
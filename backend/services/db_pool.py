@@ -0,0 +1,128 @@
+import threading
+import time
+from contextlib import contextmanager
+from psycopg2 import pool as pg_pool
+from config import (
+    connection_params,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+)
+
+
+class PoolTimeout(Exception):
+    """Aucune connexion libérée dans le délai imparti."""
+
+
+class PostgresPool:
+    """
+    Pool de connexions psycopg2 partagé par les routes synchrones.
+    - attente bornée (`timeout`) quand toutes les connexions sont prises,
+      au lieu de l'erreur immédiate de ThreadedConnectionPool ;
+    - vérification (SELECT 1) des connexions restées inactives plus de
+      `healthcheck_interval` secondes ;
+    - métriques d'utilisation et de temps d'attente.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, healthcheck_interval: float, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.conn_kwargs = conn_kwargs
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "broken": 0,
+            "in_use": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+        }
+
+    def open(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pg_pool.ThreadedConnectionPool(
+                    self.minconn, self.maxconn, **self.conn_kwargs
+                )
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+    def _checkout(self):
+        while True:
+            conn = self._pool.getconn()
+            idle = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+            if not conn.closed and idle < self.healthcheck_interval:
+                return conn
+            try:
+                if conn.closed:
+                    raise Exception("connexion fermée")
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return conn
+            except Exception:
+                with self._stats_lock:
+                    self._stats["broken"] += 1
+                self._pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self):
+        """Emprunte une connexion (autocommit) et la rend au pool en sortie."""
+        if self._pool is None:
+            self.open()
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"aucune connexion disponible après {self.timeout} s")
+        waited = (time.perf_counter() - start) * 1000
+
+        conn = None
+        try:
+            conn = self._checkout()
+            conn.autocommit = True
+            with self._stats_lock:
+                self._stats["checkouts"] += 1
+                self._stats["in_use"] += 1
+                self._stats["wait_total_ms"] += waited
+                self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], waited)
+            yield conn
+        finally:
+            if conn is not None:
+                with self._stats_lock:
+                    self._stats["in_use"] -= 1
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        return {
+            **stats,
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "wait_avg_ms": stats["wait_total_ms"] / checkouts if checkouts else 0.0,
+        }
+
+
+db_pool = PostgresPool(
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL,
+    **connection_params(),
+)
@@ -1,20 +1,186 @@
-import requests
+import asyncio
+import random
 import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_API_URL,
+    EMBEDDING_LOCAL_MODEL,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_TIMEOUT,
+    EMBEDDING_RETRIES,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DISK_CAPACITY,
+)
+from .http_client import get_http_client
+from .embedding_cache import EmbeddingCache
 
-API_URL = "https://madachat-embedder.hf.space/embed"
+API_URL = EMBEDDING_API_URL
 
-#Embedding via l'api
-def get_embedding(texts):
-    payload = {
-        "texts": texts,
-        "model":"",
-    }
 
+class ApiEmbeddingBackend:
+    """Embeddings via l'API du Space Hugging Face (timeout + retry)."""
+
+    # Plusieurs lots peuvent être en vol en même temps
+    concurrent = True
+
+    async def embed(self, texts):
+        payload = {
+            "texts": texts,
+            "model":"",
+        }
+        for attempt in range(EMBEDDING_RETRIES + 1):
+            try:
+                response = await get_http_client("embedding").post(
+                    API_URL, json=payload, timeout=EMBEDDING_TIMEOUT
+                )
+                response.raise_for_status()
+                return np.asarray(response.json()["embeddings"], dtype=np.float32)
+            except Exception:
+                if attempt == EMBEDDING_RETRIES:
+                    raise
+                # Full jitter : les lots en échec ne relancent pas tous au même instant
+                await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+
+
+class LocalEmbeddingBackend:
+    """
+    Embeddings calculés dans le processus (sentence-transformers sur CPU).
+    Utilise le modèle ONNX quantifié s'il est disponible, sinon le modèle PyTorch.
+    """
+
+    # Une seule passe avant à la fois : le parallélisme est déjà dans le lot
+    concurrent = False
+
+    def __init__(self, model_name: str = EMBEDDING_LOCAL_MODEL):
+        self.model_name = model_name
+        self._model = None
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        try:
+            model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+            return SentenceTransformer(
+                self.model_name, backend="onnx", device="cpu", model_kwargs=model_kwargs
+            )
+        except Exception as e:
+            print(f"⚠️ Modèle ONNX indisponible pour {self.model_name}, utilisation de PyTorch : {e}")
+            return SentenceTransformer(self.model_name, device="cpu")
+
+    def _encode(self, texts):
+        if self._model is None:
+            self._model = self._load()
+        return self._model.encode(
+            texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32)
+
+    async def embed(self, texts):
+        return await run_in_threadpool(self._encode, texts)
+
+
+class EmbeddingBatcher:
+    """
+    Regroupe les demandes d'embedding concurrentes arrivées dans une fenêtre de
+    quelques millisecondes en un seul appel au backend (un seul lot).
+    """
+
+    def __init__(self, backend, max_batch: int = 64, max_wait_ms: float = 5):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._pending = set()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, texts) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._ensure_worker()
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        return np.stack(await asyncio.gather(*futures))
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            if self.backend.concurrent:
+                task = asyncio.ensure_future(self._process(batch))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+            else:
+                await self._process(batch)
+
+    async def _process(self, batch):
+        # Un texte demandé plusieurs fois dans le lot n'est calculé qu'une fois
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = await self.backend.embed(unique_texts)
+            by_text = dict(zip(unique_texts, vectors))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+def _build_backend():
+    if EMBEDDING_BACKEND == "local":
+        return LocalEmbeddingBackend()
+    return ApiEmbeddingBackend()
+
+
+_batcher = EmbeddingBatcher(
+    _build_backend(),
+    max_batch=EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+)
+
+# Le namespace dépend du modèle : changer de modèle n'utilise jamais d'anciens vecteurs
+embedding_cache = EmbeddingCache(
+    namespace=EMBEDDING_LOCAL_MODEL if EMBEDDING_BACKEND == "local" else API_URL,
+    max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+    disk_dir=EMBEDDING_CACHE_DIR,
+    disk_capacity=EMBEDDING_CACHE_DISK_CAPACITY,
+)
+
+
+#Embedding via le backend configuré (API ou local), avec cache et regroupement des appels concurrents
+async def get_embedding(texts):
+    texts = list(texts)
     try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()  
-        embeddings = response.json()["embeddings"]
-        return np.array(embeddings)
+        vectors = embedding_cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = await _batcher.embed(missing)
+            embedding_cache.put_many(missing, computed)
+            # Même précision (float16) que les vecteurs servis depuis le cache
+            by_text = dict(zip(missing, computed.astype(np.float16)))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors).astype(np.float32)
     except Exception as e:
         print(f"❌ Erreur lors de l'appel à l'API d'embedding : {e}")
         return None
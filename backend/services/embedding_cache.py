@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+
+class _DiskTier:
+    """
+    Niveau disque du cache d'embeddings : vecteurs float16 dans un fichier
+    mappé en mémoire (np.memmap), index clé -> ligne dans SQLite.
+    Le fichier est circulaire : au-delà de `capacity` vecteurs, les plus anciens
+    sont écrasés. Plusieurs workers peuvent partager le même répertoire.
+    """
+
+    def __init__(self, directory: str, namespace: str, capacity: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.namespace = namespace
+        self.capacity = capacity
+        self.vectors = None
+        self.db = sqlite3.connect(
+            os.path.join(directory, f"{namespace}.sqlite3"),
+            timeout=5,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL,"
+            " row INTEGER, dim INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_row ON embeddings (row)")
+        self._lock = threading.Lock()
+
+    def _open(self, dim: int):
+        if self.vectors is not None and self.vectors.shape[1] == dim:
+            return self.vectors
+        path = os.path.join(self.directory, f"{self.namespace}-{dim}.f16")
+        mode = "r+" if os.path.exists(path) else "w+"
+        self.vectors = np.memmap(path, dtype=np.float16, mode=mode, shape=(self.capacity, dim))
+        return self.vectors
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            found = self.db.execute(
+                "SELECT row, dim FROM embeddings WHERE key = ? AND row IS NOT NULL", (key,)
+            ).fetchone()
+            if found is None:
+                return None
+            row, dim = found
+            return np.array(self._open(dim)[row])
+
+    def put(self, key: str, vector: np.ndarray):
+        with self._lock:
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO embeddings (key, dim) VALUES (?, ?)", (key, vector.shape[0])
+            )
+            if cur.rowcount == 0:
+                return
+            seq = cur.lastrowid
+            row = (seq - 1) % self.capacity
+            # L'ancienne clé de cette ligne disparaît avant que le vecteur ne soit écrasé
+            self.db.execute("DELETE FROM embeddings WHERE row = ? AND seq != ?", (row, seq))
+            self._open(vector.shape[0])[row] = vector
+            self.db.execute("UPDATE embeddings SET row = ? WHERE seq = ?", (row, seq))
+
+
+class EmbeddingCache:
+    """
+    Cache d'embeddings indexé par hash du contenu (et du modèle, via `namespace`).
+    Niveau mémoire LRU en float16, niveau disque optionnel (voir _DiskTier).
+    """
+
+    def __init__(self, namespace: str, max_entries: int, disk_dir: str = None, disk_capacity: int = 0):
+        self.namespace = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:12]
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_dir and disk_capacity:
+            try:
+                self._disk = _DiskTier(disk_dir, self.namespace, disk_capacity)
+            except Exception as e:
+                print(f"⚠️ Cache disque des embeddings indisponible : {e}")
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        results = []
+        for text in texts:
+            key = self.key(text)
+            with self._lock:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+            if vector is None and self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self._remember(key, vector)
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            results.append(vector)
+        return results
+
+    def put_many(self, texts: List[str], vectors):
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            vector = np.asarray(vector, dtype=np.float16)
+            self._remember(key, vector)
+            if self._disk is not None:
+                try:
+                    self._disk.put(key, vector)
+                except Exception as e:
+                    print(f"⚠️ Écriture du cache disque des embeddings impossible : {e}")
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._memory),
+            "bytes": sum(v.nbytes for v in self._memory.values()),
+            "disk": self._disk is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
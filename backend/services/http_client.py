@@ -0,0 +1,49 @@
+import httpx
+from config import (
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+)
+
+# Clients HTTP asynchrones partagés, un par service distant.
+# Ils sont créés une seule fois au démarrage de l'application (lifespan)
+# afin de réutiliser les connexions TCP/TLS (keep-alive) entre les requêtes.
+_clients: dict = {}
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_http_client(name: str = "default") -> httpx.AsyncClient:
+    """
+    Retourne le client partagé associé à `name` ("llm", "embedding", "sql", "render"...).
+    Le client est créé à la volée s'il n'a pas été initialisé au démarrage
+    (scripts, appels hors FastAPI).
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[name] = client
+    return client
+
+
+async def init_http_clients(*names: str):
+    for name in names or ("default",):
+        get_http_client(name)
+
+
+async def close_http_clients():
+    for client in list(_clients.values()):
+        if not client.is_closed:
+            await client.aclose()
+    _clients.clear()
@@ -0,0 +1,134 @@
+import asyncio
+from typing import List
+from fastapi.concurrency import run_in_threadpool
+from config import (
+    COLLECTION_NAME,
+    ARTICLES_SOURCE_NAMES,
+    HYBRID_RRF_K,
+    HYBRID_CANDIDATES,
+    HYBRID_TOP_K,
+    ARTICLES_CATEGORY_FILTER,
+)
+from utils.categories import category_matcher
+from .article_search import fulltext_search
+from .db_pool import db_pool
+from .retrieval import search_collections
+
+
+def lexical_sources(document_filter) -> List[str]:
+    """Sources documentaires également indexées en plein texte dans la table `articles`."""
+    return [source for source in document_filter or [] if source in ARTICLES_SOURCE_NAMES]
+
+
+def _document_key(doc: dict):
+    # Un même article (même source) renvoyé par Qdrant et par PostgreSQL ne compte qu'une fois ;
+    # ses différents passages Qdrant aussi
+    return (doc.get("source"), doc.get("numero") or doc["text"])
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = HYBRID_RRF_K, limit: int = None, prefer: int = None) -> List[dict]:
+    """
+    Fusionne plusieurs classements (Reciprocal Rank Fusion) : chaque document
+    reçoit la somme des 1 / (k + rang) sur les listes où il apparaît.
+    Seuls les rangs comptent, pas les scores (cosinus et ts_rank_cd ne sont pas comparables).
+    Dans une liste, seul le meilleur rang d'un document compte (passages d'un même article).
+    Le document conservé est celui de la liste `prefer` s'il y figure (texte complet
+    de l'article plutôt qu'un passage), sinon sa première occurrence.
+    """
+    scores, documents = {}, {}
+    for i, ranked in enumerate(ranked_lists):
+        seen = set()
+        for rank, doc in enumerate(ranked, start=1):
+            key = _document_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if i == prefer or key not in documents:
+                documents[key] = doc
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in fused[:limit]]
+
+
+def _with_scores(fused: List[dict], vector_docs: List[dict]) -> List[dict]:
+    """
+    Score des documents fusionnés, sur l'échelle cosinus de Qdrant pour rester comparable
+    aux autres collections : score vectoriel de l'article, plafonné par celui du document
+    précédent pour respecter l'ordre RRF (un article trouvé seulement en plein texte
+    reprend le score du précédent).
+    """
+    vector_scores = {}
+    for doc in vector_docs:
+        key = _document_key(doc)
+        vector_scores[key] = max(vector_scores.get(key, float("-inf")), doc.get("score") or 0.0)
+    previous = max(vector_scores.values(), default=0.0)
+    scored = []
+    for doc in fused:
+        previous = min(previous, vector_scores.get(_document_key(doc), previous))
+        scored.append({**doc, "score": previous})
+    return scored
+
+
+def _article_documents(query: str, limit: int, source: str, categories=None) -> List[dict]:
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        rows = fulltext_search(cur, query, limit, categories)
+    return [
+        {"text": f"{row['numero']}\n{row['contenu']}", "source": source, "numero": row["numero"]}
+        for row in rows
+    ]
+
+
+async def hybrid_search(client, query, query_vector, document_filter, k=HYBRID_TOP_K, candidates=HYBRID_CANDIDATES, postgres_connexions=None, logs=None):
+    """
+    Recherche hybride : Qdrant (vecteur) et plein texte PostgreSQL (numéros d'articles,
+    termes juridiques exacts) interrogés en parallèle sur `candidates` résultats chacun,
+    puis fusion RRF et conservation des `k` meilleurs.
+    Le plein texte ne s'applique qu'aux sources listées dans ARTICLES_SOURCE_NAMES.
+    Si ARTICLES_CATEGORY_FILTER est actif, les deux recherches sont restreintes aux
+    catégories détectées dans la question ; chacune est relancée sans filtre si elle ne trouve rien.
+    """
+    sources = lexical_sources(document_filter)
+
+    async def lexical(categories):
+        if not sources:
+            return []
+        try:
+            return await run_in_threadpool(_article_documents, query, candidates, sources[0], categories)
+        except Exception as e:
+            # Base indisponible : la recherche vectorielle seule reste utilisable
+            print(f"⚠️ Recherche plein texte indisponible : {e}")
+            return []
+
+    async def vector(categories):
+        if query_vector is None:
+            return []
+        results = await search_collections(client, query_vector, [{
+            "collection_name": COLLECTION_NAME,
+            "document_filter": document_filter,
+            "k": candidates,
+            "categories": categories,
+        }], postgres_connexions)
+        return results[0]
+
+    async def with_fallback(retriever, categories):
+        # Repli propre à chaque recherche : l'une peut trouver dans les catégories et pas l'autre
+        docs = await retriever(categories)
+        if categories and not docs:
+            docs = await retriever([])
+        return docs
+
+    categories = category_matcher.categories(query) if ARTICLES_CATEGORY_FILTER else []
+    vector_docs, lexical_docs = await asyncio.gather(
+        with_fallback(vector, categories), with_fallback(lexical, categories)
+    )
+
+    # Texte complet de l'article (plein texte) plutôt qu'un passage Qdrant
+    fused = reciprocal_rank_fusion([vector_docs, lexical_docs], limit=k, prefer=1)
+    fused = _with_scores(fused, vector_docs)
+    if logs is not None:
+        logs.append(
+            f"Recherche hybride : {len(vector_docs)} vecteur + {len(lexical_docs)} plein texte"
+            f" -> {len(fused)} documents (RRF)"
+            + (f", catégories {categories}" if categories else "")
+        )
+    return fused
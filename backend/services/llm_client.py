@@ -0,0 +1,291 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import httpx
+from config import (
+    AI_URL,
+    LLM_DEADLINE,
+    LLM_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_MAX_CONCURRENCY,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET,
+)
+from .http_client import get_http_client
+
+# Statuts pour lesquels une nouvelle tentative a du sens
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Échec d'un appel au LLM après les tentatives autorisées."""
+
+
+class LLMTimeout(LLMError):
+    """Délai maximal de l'appel dépassé."""
+
+
+class LLMUnavailable(LLMError):
+    """Fournisseur considéré comme indisponible (circuit ouvert) : échec immédiat."""
+
+
+class CircuitBreaker:
+    """
+    Après `failures` échecs consécutifs, le circuit s'ouvre : les appels échouent
+    immédiatement pendant `reset_timeout` secondes, puis un appel d'essai est
+    autorisé (semi-ouvert) ; son succès referme le circuit. Un essai resté sans
+    issue (appel annulé) est remplacé au bout de `reset_timeout` secondes.
+    """
+
+    def __init__(self, failures: int, reset_timeout: float):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half-open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._trial_at is not None or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic()
+        self._trial_at = None
+
+
+class LatencyTracker:
+    """Latences des derniers appels réussis, pour estimer le p95."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < 20:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class LLMClient:
+    """
+    Client du endpoint chat/completions :
+    - délai maximal par appel (toutes tentatives comprises) ;
+    - nouvelles tentatives avec backoff exponentiel et jitter sur 429 / 5xx / erreurs réseau
+      (en respectant Retry-After) ;
+    - requête dupliquée (hedging, optionnelle) si la première dépasse le p95 observé ;
+    - disjoncteur qui échoue immédiatement quand le fournisseur est en panne ;
+    - nombre d'appels simultanés limité.
+    """
+
+    def __init__(self, url: str, client_name: str = "llm", deadline: float = 60, retries: int = 2,
+                 retry_base_delay: float = 0.5, hedge: bool = False, hedge_min_delay: float = 2.0,
+                 max_concurrency: int = 32, breaker: CircuitBreaker = None):
+        self.url = url
+        self.client_name = client_name
+        self.deadline = deadline
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker(5, 30)
+        self.latencies = LatencyTracker()
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._loop = None
+        self._stats = {"calls": 0, "retries": 0, "hedges": 0, "timeouts": 0, "rejected": 0, "failures": 0}
+
+    def _retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        # Full jitter : évite que les clients relancent tous au même instant
+        return random.uniform(0, self.retry_base_delay * 2 ** attempt)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS
+        return isinstance(error, httpx.TransportError)
+
+    async def _post(self, headers, body) -> dict:
+        start = time.monotonic()
+        response = await get_http_client(self.client_name).post(self.url, headers=headers, content=body)
+        response.raise_for_status()
+        self.latencies.add(time.monotonic() - start)
+        return response.json()
+
+    async def _hedged_post(self, headers, body) -> dict:
+        p95 = self.latencies.p95() if self.hedge else None
+        if p95 is None:
+            return await self._post(headers, body)
+
+        tasks = {asyncio.ensure_future(self._post(headers, body))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(p95, self.hedge_min_delay))
+            if not done:
+                # La première requête est anormalement lente : une seconde part en parallèle
+                self._stats["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._post(headers, body)))
+
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Un sémaphore par boucle d'événements (tests, scripts lancés avec asyncio.run)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def _slot(self, deadline_at: float):
+        if not self.breaker.allow():
+            self._stats["rejected"] += 1
+            raise LLMUnavailable("fournisseur LLM indisponible (circuit ouvert)")
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(deadline_at - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise LLMTimeout("délai dépassé en attente d'un créneau d'appel LLM")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def complete(self, headers, body, deadline: float = None) -> dict:
+        """Appel non streamé ; retourne la réponse JSON du fournisseur."""
+        self._stats["calls"] += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        async with self._slot(deadline_at):
+            attempt = 0
+            while True:
+                remaining = deadline_at - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    result = await asyncio.wait_for(self._hedged_post(headers, body), remaining)
+                    self.breaker.record_success()
+                    return result
+                except asyncio.TimeoutError:
+                    self._stats["timeouts"] += 1
+                    self.breaker.record_failure()
+                    raise LLMTimeout(f"pas de réponse du LLM en {deadline or self.deadline:.0f} s")
+                except Exception as e:
+                    if not self._is_retryable(e):
+                        # Erreur de la requête elle-même (4xx) : le fournisseur répond, le circuit reste fermé
+                        self.breaker.record_success()
+                        raise LLMError(f"appel LLM refusé : {e}") from e
+                    self.breaker.record_failure()
+                    response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+                    delay = self._retry_delay(attempt, response)
+                    if attempt >= self.retries or time.monotonic() + delay >= deadline_at or not self.breaker.allow():
+                        self._stats["failures"] += 1
+                        raise LLMError(f"appel LLM en échec après {attempt + 1} tentative(s) : {e}") from e
+                    attempt += 1
+                    self._stats["retries"] += 1
+                    await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, headers, body, deadline: float = None):
+        """
+        Appel streamé : délai et tentatives ne portent que sur l'ouverture de la réponse
+        (avant le premier fragment) ; ensuite le timeout de lecture du client HTTP s'applique.
+        """
+        self._stats["calls"] += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        async with self._slot(deadline_at):
+            client = get_http_client(self.client_name)
+            attempt = 0
+            while True:
+                request = client.build_request("POST", self.url, headers=headers, content=body)
+                try:
+                    response = await asyncio.wait_for(
+                        client.send(request, stream=True), max(deadline_at - time.monotonic(), 0)
+                    )
+                    response.raise_for_status()
+                    break
+                except asyncio.TimeoutError:
+                    self._stats["timeouts"] += 1
+                    self.breaker.record_failure()
+                    raise LLMTimeout(f"pas de réponse du LLM en {deadline or self.deadline:.0f} s")
+                except Exception as e:
+                    if isinstance(e, httpx.HTTPStatusError):
+                        await e.response.aclose()
+                    if not self._is_retryable(e):
+                        self.breaker.record_success()
+                        raise LLMError(f"appel LLM refusé : {e}") from e
+                    self.breaker.record_failure()
+                    response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+                    delay = self._retry_delay(attempt, response)
+                    if attempt >= self.retries or time.monotonic() + delay >= deadline_at or not self.breaker.allow():
+                        self._stats["failures"] += 1
+                        raise LLMError(f"appel LLM en échec après {attempt + 1} tentative(s) : {e}") from e
+                    attempt += 1
+                    self._stats["retries"] += 1
+                    await asyncio.sleep(delay)
+            try:
+                self.breaker.record_success()
+                yield response
+            finally:
+                await response.aclose()
+
+    def stats(self) -> dict:
+        p95 = self.latencies.p95()
+        return {
+            **self._stats,
+            "circuit": self.breaker.state,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+
+llm_client = LLMClient(
+    AI_URL,
+    deadline=LLM_DEADLINE,
+    retries=LLM_RETRIES,
+    retry_base_delay=LLM_RETRY_BASE_DELAY,
+    hedge=LLM_HEDGE_ENABLED,
+    hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET),
+)
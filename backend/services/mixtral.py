@@ -1,4 +1,3 @@
-import requests
 import json
 import os
 from datetime import datetime
@@ -8,89 +7,105 @@ from .cache import *
 from .postgres import *
 import re
 from typing import List, Dict, Any
+from .chatbot_config import get_chatbot_config
+from .classifier import request_classifier
+from .llm_client import llm_client, LLMError
+from .source_router import source_router
+from .context_budget import pack_documents, context_budget, format_rows, DOC_SEPARATOR
 
 # === Fonctions utilitaires ===
-import joblib
-
-# Chargement du modèle et du vectorizer
-model = joblib.load("request_classifier_model.pkl")
-vectorizer = joblib.load("request_vectorizer.pkl")
-
 
 def is_question_or_request(text: str) -> bool:
-    X = vectorizer.transform([text])
-    prediction = model.predict(X)[0]
-    return bool(prediction)
+    # Modèle chargé au premier appel, résultat mémorisé par texte (voir services/classifier.py)
+    return request_classifier.is_request(text)
 
 
-def call_llm(model, messages, temperature=0.5, max_tokens=600):
+def _llm_request(model, messages, temperature, max_tokens, stream=False):
     payload = {
         "model": model,
         "messages": messages,
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
+    if stream:
+        payload["stream"] = True
     headers = {
         "Authorization": f"Bearer {AI_TOKEN}",
         "Content-Type": "application/json",
     }
-    response = requests.post(AI_URL, headers=headers, data=json.dumps(payload))
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"].strip()
-
-
-def build_contexte(docs):
-    return "\n---\n".join(
-        f"{doc['text']}\n(Source: {doc.get('source', 'inconnu')})" for doc in docs
-    )
+    return headers, json.dumps(payload)
 
 
-def get_chatbot_description(chatbot_id):
-    try:
-        res = (
-            supabase.table("chatbots")
-            .select("description")
-            .eq("id", chatbot_id)
-            .single()
-            .execute()
-        )
-        return res.data.get("description", "").strip()
-    except Exception:
-        return ""
+async def call_llm(model, messages, temperature=0.5, max_tokens=600):
+    # Délai, nouvelles tentatives et disjoncteur : voir services/llm_client.py (lève LLMError)
+    headers, body = _llm_request(model, messages, temperature, max_tokens)
+    data = await llm_client.complete(headers, body)
+    return data["choices"][0]["message"]["content"].strip()
 
 
-def get_connexion_info(chatbot_id):
-    try:
-        res = (
-            supabase.table("chatbot_pgsql_connexions")
-            .select("connexion_name, sql_reasoning")
-            .eq("chatbot_id", chatbot_id)
-            .single()
-            .execute()
+async def stream_llm(model, messages, temperature=0.5, max_tokens=600):
+    """
+    Même appel que call_llm, mais en streaming (SSE compatible OpenAI) :
+    produit les fragments de texte au fur et à mesure de leur génération.
+    """
+    headers, body = _llm_request(model, messages, temperature, max_tokens, stream=True)
+    async with llm_client.stream(headers, body) as response:
+        async for line in response.aiter_lines():
+            line = line.strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+def build_contexte(docs, budget=None, logs=None):
+    """
+    Contexte documentaire du prompt : doublons et quasi-doublons retirés, puis, si `budget`
+    (tokens) est donné, documents les mieux classés qui y tiennent (voir services/context_budget.py).
+    """
+    blocks, stats = pack_documents(docs, budget)
+    if logs is not None:
+        logs.append(
+            f"Contexte : {len(blocks)}/{stats['documents']} documents, ~{stats['tokens']} tokens"
+            + (f" (budget {budget})" if budget is not None else "")
+            + f", {stats['duplicates']} doublon(s), {stats['truncated']} tronqué(s), {stats['dropped']} écarté(s)"
         )
-        name = res.data["connexion_name"]
-        enabled = res.data.get("sql_reasoning", False)
-
-        schema, params = "", {}
-        if enabled:
-            res_conn = (
-                supabase.table("postgresql_connexions")
-                .select(
-                    "data_schema, host_name, port, user, password, database, ssl_mode"
-                )
-                .eq("connexion_name", name)
-                .single()
-                .execute()
-            )
-            schema = res_conn.data.get("data_schema", "").strip()
-            params = res_conn.data
-        return name, enabled, schema, params
-    except Exception as e:
-        print(f"[Erreur chargement SQL reasoning ou schéma] : {e}")
-        return "", False, "", {}
+    return DOC_SEPARATOR.join(blocks)
+
+
+# Règles de rédaction de la réponse finale (reformulation claire), partagées par la
+# reformulation de /ask et par la génération directe du mode "single"
+CONSIGNES_STYLE_FINAL = (
+    "Règles à suivre :\n"
+    "1. N'ajoute aucune information nouvelle et ne modifie pas le sens du texte.\n"
+    "2. Organise le texte avec des paragraphes clairs et des titres ou expressions importantes en **gras**.\n"
+    "3. Explique ou reformule les passages techniques si nécessaire, sans trahir le contenu.\n"
+    "4. Évite tout ton robotique ou académique excessif — le texte doit être lisible et humain.\n"
+    "5. Écris uniquement en français, sans anglais ni caractères techniques (JSON, crochets, guillemets inutiles, etc.).\n"
+    "6. Si le texte contient plusieurs articles, sépare-les proprement avec des sous-titres explicites.\n"
+    "7. Ne traduis pas les termes juridiques ou noms d’articles du Code civil."
+)
+
+
+def _style_final_prompt() -> str:
+    return (
+        "\n\nRédige directement la réponse finale destinée à l'utilisateur, "
+        "claire et pédagogique, en français naturel et fluide.\n" + CONSIGNES_STYLE_FINAL
+    )
 
 
-def build_system_prompt(query, description, sql_reasoning_enabled, schema_text, discu):
+def build_system_prompt(query, description, sql_reasoning_enabled, schema_text, discu, final_style=False):
     prompt = (
         "Tu es un assistant intelligent, clair et naturel. "
         f"Tu suis la consigne suivante : {description or 'réponds poliment et avec clarté.'} "
@@ -110,17 +125,20 @@ def build_system_prompt(query, description, sql_reasoning_enabled, schema_text,
 
     else:
         prompt += "\n\nSi tu ne trouves pas la réponse dans les contextes fournis, indique que l'information n'est pas disponible."
+        if final_style:
+            prompt += _style_final_prompt()
     return prompt
 
 
 # === Fonctions principales ===
 
 
-def reformulate_answer_via_llm(query, contexte_text):
+async def reformulate_answer_via_llm(query, contexte_text, final_style=False):
     messages = [
         {
             "role": "system",
-            "content": "Tu es un assistant intelligent, clair et naturel.",
+            "content": "Tu es un assistant intelligent, clair et naturel."
+            + (_style_final_prompt() if final_style else ""),
         },
         {
             "role": "user",
@@ -133,19 +151,26 @@ def reformulate_answer_via_llm(query, contexte_text):
             ),
         },
     ]
-    return call_llm("mixtral", messages)
+    return await call_llm("mixtral", messages)
 
 
-def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dict]:
+async def load_chatbot_sources(chatbot_id: str) -> Dict[str, List[Dict]]:
     """
-    Sélectionne les sources les plus pertinentes (documents, connexions, slots) pour un chatbot.
-    Utilise le LLM pour filtrer, avec fallback automatique pour les slots si le LLM renvoie vide.
+    Retourne les connexions, documents et slots d'un chatbot (depuis le cache de configuration).
+    """
+    return (await get_chatbot_config(chatbot_id)).sources
+
+
+def candidate_sources(question: str, chatbot_sources: Dict[str, List[Dict]]) -> List[Dict]:
+    """
+    Sources proposées au LLM : connexions et documents si le message est une demande,
+    slots dans tous les cas.
     """
     sources = []
 
     # --- Connexions et documents ---
     if is_question_or_request(question):
-        for c in get_connexions_for_chatbot(chatbot_id):
+        for c in chatbot_sources["connexions"]:
             sources.append(
                 {
                     "type": "connexion",
@@ -153,7 +178,7 @@ def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dic
                     "description": c.get("description"),
                 }
             )
-        for d in get_documents_for_chatbot(chatbot_id):
+        for d in chatbot_sources["documents"]:
             sources.append(
                 {
                     "type": "document",
@@ -163,7 +188,7 @@ def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dic
             )
 
     # --- Slots ---
-    for s in get_slots_for_chatbot(chatbot_id):
+    for s in chatbot_sources["slots"]:
         sources.append(
             {
                 "type": "slot",
@@ -171,10 +196,66 @@ def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dic
                 "description": s.get("description"),
             }
         )
+    return sources
+
+
+def select_sources(sources: List[Dict], selected_names) -> List[Dict]:
+    """
+    Sources retenues parmi `sources` d'après les noms choisis par le LLM,
+    avec fallback automatique sur les slots si le LLM n'en a retenu aucune.
+    """
+    # Auto-fix si le LLM renvoie une liste d'objets au lieu de noms
+    if isinstance(selected_names, list) and all(
+        isinstance(n, dict) for n in selected_names
+    ):
+        selected_names = [n.get("name") for n in selected_names if "name" in n]
+
+    # --- Fallback automatique pour inclure les slots si LLM vide ---
+    if not selected_names:
+        slot_names = [s["name"] for s in sources if s["type"] == "slot"]
+        selected_names = slot_names
+
+    # --- Sélection finale des sources ---
+    if isinstance(selected_names, list) and all(
+        isinstance(n, str) for n in selected_names
+    ):
+        selected_sources = [s for s in sources if s["name"] in selected_names]
+        print(f"====== SOURCES CHATBOT: {selected_sources}")
+        return selected_sources
+    else:
+        print("⚠️ Format inattendu : attendu liste de noms (strings).")
+        return []
+
+
+def parse_llm_json(result: str):
+    """JSON renvoyé par le LLM, après suppression des échappements parasites."""
+    cleaned_result = re.sub(r'\\([^\\"/bfnrtu])', r"\1", result).strip()
+    return json.loads(cleaned_result)
+
+
+async def ask_mixtral_for_relevant_sources(
+    chatbot_id: str, question: str, chatbot_sources: Dict[str, List[Dict]] = None
+) -> List[Dict]:
+    """
+    Sélectionne les sources les plus pertinentes (documents, connexions, slots) pour un chatbot.
+    Routage local par embeddings (services/source_router.py) ; le LLM ne filtre que si
+    ce choix est ambigu, avec fallback automatique pour les slots s'il renvoie vide.
+    `chatbot_sources` (voir load_chatbot_sources) évite de recharger les sources si elles sont déjà connues.
+    """
+    chatbot_config = await get_chatbot_config(chatbot_id)
+    if chatbot_sources is None:
+        chatbot_sources = chatbot_config.sources
+    sources = candidate_sources(question, chatbot_sources)
 
     if not sources:
         return []
 
+    # --- Routage local par similarité avec les descriptions des sources ---
+    if source_router is not None:
+        routed = await source_router.route(f"{chatbot_id}:{chatbot_config.version}", question, sources)
+        if routed is not None:
+            return select_sources(sources, [s["name"] for s in routed])
+
     # --- Prompt pour le LLM ---
     prompt = (
         "Tu es un assistant intelligent chargé de sélectionner les sources les plus pertinentes pour répondre à une demande.\n"
@@ -186,7 +267,7 @@ def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dic
     )
 
     try:
-        result = call_llm(
+        result = await call_llm(
             "mixtral",
             [
                 {
@@ -198,37 +279,16 @@ def ask_mixtral_for_relevant_sources(chatbot_id: str, question: str) -> List[Dic
         )
 
         # Nettoyage du résultat LLM
-        cleaned_result = re.sub(r'\\([^\\"/bfnrtu])', r"\1", result).strip()
-        selected_names = json.loads(cleaned_result)
-
-        # Auto-fix si le LLM renvoie une liste d'objets au lieu de noms
-        if isinstance(selected_names, list) and all(
-            isinstance(n, dict) for n in selected_names
-        ):
-            selected_names = [n.get("name") for n in selected_names if "name" in n]
+        selected_names = parse_llm_json(result)
 
     except Exception as e:
         print(f"⚠️ Erreur parsing JSON LLM ou appel LLM : {e}")
         selected_names = []
 
-    # --- Fallback automatique pour inclure les slots si LLM vide ---
-    if not selected_names:
-        slot_names = [s["name"] for s in sources if s["type"] == "slot"]
-        selected_names = slot_names
-
-    # --- Sélection finale des sources ---
-    if isinstance(selected_names, list) and all(
-        isinstance(n, str) for n in selected_names
-    ):
-        selected_sources = [s for s in sources if s["name"] in selected_names]
-        print(f"====== SOURCES CHATBOT: {selected_sources}")
-        return selected_sources
-    else:
-        print("⚠️ Format inattendu : attendu liste de noms (strings).")
-        return []
+    return select_sources(sources, selected_names)
 
 
-def extract_slots_with_llm(
+async def extract_slots_with_llm(
     user_input: str,
     expected_slots: list[dict],
     slot_state: dict,
@@ -250,7 +310,8 @@ def extract_slots_with_llm(
     missing_slots = {k: v for k, v in full_slot_schema.items() if not slot_state.get(k)}
 
     # Récupérer toutes les valeurs possibles pour ce chatbot
-    possible_values = get_possible_values_for_chatbot(chatbot_id)  # List[str]
+    chatbot_config = await get_chatbot_config(chatbot_id)
+    possible_values = chatbot_config.possible_values  # List[str]
     print(f"VALEURS SLOTS: {keyword}")
     print(f"VALEURS POSSIBLES: {possible_values}")
     print(f"INPUT UTILISATEUR: {user_input}")
@@ -278,7 +339,9 @@ def extract_slots_with_llm(
         ]
 
         try:
-            keyword_candidate = call_llm("mixtral", llm_prompt, max_tokens=5).strip()
+            keyword_candidate = (
+                await call_llm("mixtral", llm_prompt, max_tokens=5)
+            ).strip()
 
             import string
 
@@ -308,7 +371,7 @@ def extract_slots_with_llm(
             keyword = None
 
         # Appel API si nécessaire
-        web_action_api_url = process_chatbot_web_actions(chatbot_id)
+        web_action_api_url = chatbot_config.web_action_url
         if web_action_api_url:
             api_url_with_slots = f"{web_action_api_url}{keyword or ''}"
             print(f"🌐 Appel API : {api_url_with_slots}")
@@ -331,7 +394,7 @@ def extract_slots_with_llm(
     }
     user_prompt = {"role": "user", "content": user_input}
 
-    response = call_llm("mixtral", [system_prompt, user_prompt])
+    response = await call_llm("mixtral", [system_prompt, user_prompt])
 
     try:
         extracted = json.loads(response)
@@ -452,25 +515,39 @@ def extract_sources(docs):
     return list({doc.get("source", "inconnu") for doc in docs})
 
 
-def generate_answer(query, docs, chatbot_id=None, max_retries=3):
+async def generate_answer(query, docs, chatbot_id=None, max_retries=3, on_token=None, final_style=False):
+    """
+    `on_token` (coroutine optionnelle) reçoit les fragments de la réponse au fil de
+    la génération, lorsque la réponse n'est pas une requête SQL.
+    `final_style` : la réponse (ou la reformulation du résultat SQL) est rédigée
+    directement dans le style final, sans reformulation ultérieure (mode "single").
+    Retourne {"answer", "logs", "error"} ; `error` signale un message d'erreur à la place
+    de la réponse (jamais mis en cache, pas plus que les réponses issues d'une requête SQL).
+    """
     logs = []
-    cached = get_cache(query, docs)
+    # Clé calculée une seule fois : docs est enrichi plus bas (résultat SQL)
+    cache_key = make_cache_key(query, docs, f"{chatbot_id or ''}:final" if final_style else chatbot_id)
+    cached = get_cache(query, docs, key=cache_key)
     if cached:
         logs.append("Utilisation du cache")
         return {
             "answer": cached,
             "logs": logs,
+            "error": False,
         }
 
-    description = get_chatbot_description(chatbot_id)
+    chatbot_config = await get_chatbot_config(chatbot_id)
+    description = chatbot_config.description
     connexion_name, sql_reasoning_enabled, schema_text, connexion_params = (
-        get_connexion_info(chatbot_id)
+        chatbot_config.connexion_info
     )
 
+    # Réponse construite à partir de lignes lues en direct dans la base : jamais mise en cache
+    sql_path = sql_reasoning_enabled and len(docs) > 0
     system_prompt = build_system_prompt(
-        query, description, (sql_reasoning_enabled and len(docs) > 0), schema_text, ""
+        query, description, sql_path, schema_text, "", final_style
     )
-    contexte = build_contexte(docs)
+    contexte = build_contexte(docs, context_budget("mixtral", system_prompt, query, max_tokens=300), logs)
 
     sources_used = extract_sources(docs)
     extracted_sql = None
@@ -488,19 +565,33 @@ def generate_answer(query, docs, chatbot_id=None, max_retries=3):
 
     try:
         logs.append(f"Requête envoyés:{messages}")
-        raw_result = call_llm("mixtral", messages, temperature=0, max_tokens=300)
+        if on_token is not None and not sql_path:
+            tokens = []
+            async for token in stream_llm(
+                "mixtral", messages, temperature=0, max_tokens=300
+            ):
+                tokens.append(token)
+                await on_token(token)
+            raw_result = "".join(tokens).strip()
+        else:
+            raw_result = await call_llm(
+                "mixtral", messages, temperature=0, max_tokens=300
+            )
         logs.append(f"🔧 Résulat brut du LLM:{raw_result}")
+    except LLMError:
+        # Fournisseur lent ou indisponible : propagé jusqu'à /ask (503), rien n'est mis en cache
+        raise
     except Exception as e:
         raw_result = f"Erreur lors de la génération de la réponse : {str(e)}"
-
-        set_cache(query, docs, raw_result)
         return {
             "answer": raw_result,
             "logs": logs,
+            "error": True,
         }
 
     final_answer = raw_result
-    if sql_reasoning_enabled and len(docs) > 0:
+    failed = False
+    if sql_path:
         retry_count = 0
         tried_heuristic = False  # Pour ne corriger heuristiquement qu'une fois
 
@@ -517,7 +608,7 @@ def generate_answer(query, docs, chatbot_id=None, max_retries=3):
 
             try:
                 # 1ère tentative ou tentative après LLM/heuristique
-                sql_result = execute_sql_via_api(connexion_params, extracted_sql)
+                sql_result = await execute_sql_via_api(connexion_params, extracted_sql)
                 if sql_result is not None:
                     logs.append(f"Résultat SQL: {sql_result}")
                     docs.insert(
@@ -526,22 +617,25 @@ def generate_answer(query, docs, chatbot_id=None, max_retries=3):
                             "text": (
                                 f"Résultat SQL pour la requête suivante : {query}\n"
                                 f"Code SQL : {extracted_sql}\n\n"
-                                f"Résultat :\n{json.dumps(sql_result, indent=2, ensure_ascii=False)}"
+                                f"Résultat :\n{format_rows(sql_result)}"
                             ),
                             "source": "résultat_sql",
+                            "pinned": True,
                         },
                     )
                     logs.append(
                         f"insertion de résulat de l'sql:{json.dumps(sql_result, indent=2, ensure_ascii=False)}"
                     )
-                    final_answer = reformulate_answer_via_llm(
-                        query, build_contexte(docs)
+                    final_answer = await reformulate_answer_via_llm(
+                        query, build_contexte(docs, context_budget("mixtral", query, max_tokens=600), logs), final_style
                     )
                     break  # Succès
                 else:
                     logs.append("Résultat SQL vide ou invalide")
                     raise Exception("Résultat SQL vide ou invalide")
 
+            except LLMError:
+                raise
             except Exception as e:
                 logs.append(f"Erreur exécution SQL: {e}")
 
@@ -557,6 +651,7 @@ def generate_answer(query, docs, chatbot_id=None, max_retries=3):
 
                 if retry_count == max_retries:
                     final_answer = f"Erreur lors de l'exécution de la requête SQL : {e}\nRequête SQL : {extracted_sql}"
+                    failed = True
                     logs.append(
                         f"Tentative de correction max atteint, résultat final:{final_answer} "
                     )
@@ -579,17 +674,19 @@ def generate_answer(query, docs, chatbot_id=None, max_retries=3):
                     },
                 ]
                 logs.append(f"Prompt de correction:{correction_prompt} ")
-                raw_result = call_llm(
+                raw_result = await call_llm(
                     "mixtral", correction_prompt, temperature=0, max_tokens=200
                 )
                 retry_count += 1
         else:
             # Si on sort de la boucle sans break (pas de requête SQL correcte)
-            final_answer = reformulate_answer_via_llm(query, contexte)
+            final_answer = await reformulate_answer_via_llm(query, contexte, final_style)
             logs.append(f"Résulat finale:{final_answer}")
-    set_cache(query, docs, final_answer)
+    if not failed and not sql_path:
+        set_cache(query, docs, final_answer, key=cache_key)
 
     return {
         "answer": final_answer,
         "logs": logs,
+        "error": failed,
     }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import re
+from typing import Dict, List
+from config import CLARIFY_CACHE_TTL, CLARIFY_CACHE_MAX_ENTRIES
+from services.mixtral import call_llm, candidate_sources, select_sources, parse_llm_json
+from services.clarifier import needs_coreference
+from services.source_router import source_router
+from services.cache import TTLCache
+
+# Premier objet JSON de la réponse (le LLM ajoute parfois du texte autour)
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+# Plans déjà calculés, par (historique utile, question, sources proposées)
+_plans = TTLCache(maxsize=CLARIFY_CACHE_MAX_ENTRIES, ttl=CLARIFY_CACHE_TTL)
+
+
+def _plan_key(history: List[dict], question: str, sources: List[Dict]) -> str:
+    h = hashlib.sha256(json.dumps(history, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    h.update(b"\x1e")
+    h.update(question.strip().encode("utf-8"))
+    h.update(b"\x1e")
+    h.update(json.dumps(sources, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _format_history(history: List[dict]) -> str:
+    formatted_history = ""
+    for msg in history:
+        role = "Utilisateur" if msg["role"] == "user" else "Assistant"
+        formatted_history += f"{role} : {msg['content'].strip()}\n"
+    return formatted_history.strip()
+
+
+def _build_plan_prompt(history: List[dict], question: str, sources: List[Dict], resolve: bool):
+    consignes = (
+        "Tu es un assistant intelligent qui travaille exclusivement en **français**.\n"
+        "Tu prépares le traitement d'un message utilisateur.\n"
+    )
+    if resolve:
+        consignes += (
+            "1. Résous les coréférences du message : remplace les pronoms et expressions référentielles "
+            "(« il », « elle », « cela », « ce dernier », « le même », etc.) par les noms ou entités "
+            "de l'historique. Ne remplace **jamais** je, tu, nous, vous. Ne réponds pas au message.\n"
+        )
+    else:
+        consignes += "1. Recopie le message tel quel dans \"question\".\n"
+    consignes += (
+        "2. Sélectionne, parmi les sources disponibles, les plus pertinentes pour répondre au message.\n\n"
+        "Réponds uniquement par un objet JSON de la forme :\n"
+        '{"question": "<message reformulé>", "sources": ["<nom exact de source>", ...]}\n'
+        "Sans explication ni commentaire."
+    )
+
+    contenu = ""
+    if resolve:
+        contenu += f"Historique de la conversation :\n{_format_history(history)}\n\n"
+    contenu += f"Message reçu :\n{question.strip()}\n\n"
+    contenu += f"Sources disponibles :\n{json.dumps(sources, ensure_ascii=False, indent=2)}"
+
+    return [
+        {"role": "system", "content": consignes},
+        {"role": "user", "content": contenu},
+    ]
+
+
+async def plan_request(
+    history: List[dict], question: str, chatbot_sources: Dict[str, List[Dict]], clarify: bool = True,
+    namespace: str = "",
+) -> dict:
+    """
+    Mode "single" : clarification et sélection des sources en un seul appel LLM
+    (réponse JSON structurée), au lieu de clarify_question puis ask_mixtral_for_relevant_sources.
+    `clarify` à False désactive la résolution des coréférences (message non classé comme demande).
+    Sans coréférence à résoudre, les sources sont d'abord routées localement par embeddings
+    (`namespace` : chatbot et version de configuration) ; le LLM n'est appelé que si ce choix est ambigu.
+    Retourne {"question": <question clarifiée>, "sources": [<sources retenues>], "llm": <appel effectué>}.
+    """
+    question = question.strip()
+    sources = candidate_sources(question, chatbot_sources)
+    resolve = clarify and needs_coreference(history, question)
+    if not sources and not resolve:
+        return {"question": question, "sources": [], "llm": False}
+
+    if not resolve and source_router is not None:
+        routed = await source_router.route(namespace, question, sources)
+        if routed is not None:
+            selected = select_sources(sources, [s["name"] for s in routed])
+            return {"question": question, "sources": selected, "llm": False}
+
+    key = _plan_key(history if resolve else [], question, sources)
+    cached = _plans.get(key)
+    if cached is not None:
+        return {**cached, "llm": False}
+
+    clarified, selected_names, parsed = question, [], False
+    result = await call_llm(
+        "mixtral", _build_plan_prompt(history, question, sources, resolve), temperature=0
+    )
+    try:
+        match = JSON_OBJECT_PATTERN.search(result)
+        plan = parse_llm_json(match.group(0) if match else result)
+        if resolve and isinstance(plan.get("question"), str) and plan["question"].strip():
+            clarified = plan["question"].strip()
+        selected_names = plan.get("sources") or []
+        parsed = True
+    except Exception as e:
+        print(f"⚠️ Erreur parsing JSON du plan LLM : {e}")
+
+    planned = {"question": clarified, "sources": select_sources(sources, selected_names)}
+    if parsed:
+        _plans.set(key, planned)
+    return {**planned, "llm": True}
@@ -1,8 +1,8 @@
 import os
-import requests
+from .http_client import get_http_client
 from utils.helpers import generate_jwt
 
-def execute_sql_via_api(connexion_params, extracted_sql):
+async def execute_sql_via_api(connexion_params, extracted_sql):
     try:
         url = os.getenv("POSTGRESS_SQL_EXECUTOR")
         payload = {
@@ -20,7 +20,7 @@ def execute_sql_via_api(connexion_params, extracted_sql):
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = await get_http_client("sql").post(url, json=payload, headers=headers)
         response.raise_for_status()
         result = response.json()
         print(f"response:{result}")
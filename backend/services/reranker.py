@@ -0,0 +1,97 @@
+import threading
+from typing import List
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from config import (
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_ONNX_FILE,
+    RERANK_MAX_LENGTH,
+    RERANK_TOP_N,
+)
+
+
+class CrossEncoderReranker:
+    """
+    Reclassement local (CPU) des documents récupérés : un cross-encoder évalue chaque
+    paire (question, document), tous les candidats en une seule passe avant.
+    Utilise le modèle ONNX quantifié s'il est disponible, sinon le modèle PyTorch.
+    """
+
+    def __init__(self, model_name: str, top_n: int = 5, max_length: int = 512):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.max_length = max_length
+        self._model = None
+        # Une seule passe avant à la fois : le parallélisme est déjà dans le lot
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "candidates": 0, "kept": 0, "errors": 0}
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, n in increments.items():
+                self._stats[name] += n
+
+    def _load(self):
+        from sentence_transformers import CrossEncoder
+
+        try:
+            model_kwargs = {"file_name": RERANK_ONNX_FILE} if RERANK_ONNX_FILE else None
+            return CrossEncoder(
+                self.model_name, max_length=self.max_length, backend="onnx", device="cpu", model_kwargs=model_kwargs
+            )
+        except Exception as e:
+            print(f"⚠️ Modèle ONNX indisponible pour {self.model_name}, utilisation de PyTorch : {e}")
+            return CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+
+    def _predict(self, pairs) -> np.ndarray:
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return np.asarray(
+                self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False), dtype=np.float32
+            )
+
+    async def rerank_many(self, query: str, ranked_lists: List[List[dict]], top_n: int = None) -> List[List[dict]]:
+        """
+        Reclasse chaque liste de documents et garde ses `top_n` meilleurs ;
+        les paires de toutes les listes partent dans un même lot.
+        En cas d'erreur, chaque liste est seulement tronquée (ordre Qdrant conservé).
+        """
+        top_n = top_n or self.top_n
+        pairs = [(query, doc.get("text", "")) for docs in ranked_lists for doc in docs]
+        if not pairs:
+            return [list(docs) for docs in ranked_lists]
+
+        try:
+            scores = await run_in_threadpool(self._predict, pairs)
+        except Exception as e:
+            print(f"⚠️ Reclassement indisponible, ordre de la recherche vectorielle conservé : {e}")
+            self._count(errors=1)
+            return [list(docs[:top_n]) for docs in ranked_lists]
+
+        reranked, start = [], 0
+        for docs in ranked_lists:
+            list_scores = scores[start:start + len(docs)]
+            start += len(docs)
+            # Tri stable : à score égal, l'ordre de la recherche est conservé
+            order = np.argsort(-list_scores, kind="stable")[:top_n]
+            # Le score du cross-encoder remplace celui de la recherche (classement du contexte)
+            reranked.append([{**docs[i], "score": float(list_scores[i])} for i in order])
+
+        self._count(calls=1, candidates=len(pairs), kept=sum(len(docs) for docs in reranked))
+        return reranked
+
+    async def rerank(self, query: str, docs: List[dict], top_n: int = None) -> List[dict]:
+        return (await self.rerank_many(query, [docs], top_n))[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {**stats, "model": self.model_name, "loaded": self._model is not None}
+
+
+reranker = CrossEncoderReranker(
+    RERANK_MODEL, top_n=RERANK_TOP_N, max_length=RERANK_MAX_LENGTH
+) if RERANK_ENABLED else None
@@ -1,24 +1,26 @@
 
 from .embedding import get_embedding
-from qdrant_client.models import Filter, FieldCondition, MatchAny,MatchValue
-import requests
+import asyncio
+import hashlib
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchAny,MatchValue, QueryRequest
+from fastapi.concurrency import run_in_threadpool
+from .http_client import get_http_client
 from utils.helpers import generate_jwt
 from config import *
+from .cache import TTLCache
+from .reranker import reranker
 
-def get_postgres_service_url(source_name: str) -> str:
-    try:
-        response = supabase.table("postgresql_connexions") \
-            .select("postgres_service_url") \
-            .eq("connexion_name", source_name) \
-            .single() \
-            .execute()
+RENDER_ERROR = "[Erreur de rendu]"
 
-        return response.data.get("postgres_service_url", "")
-    except Exception as e:
-        print(f"[Erreur Supabase] Impossible de récupérer l'URL du service PostgreSQL pour '{source_name}': {e}")
-        return ""
+# Client Qdrant partagé (pipeline /ask et recherche hybride des articles)
+qdrant_client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+# Rendus de templates déjà calculés, par (connexion, hash du template)
+_render_cache = TTLCache(maxsize=RENDER_CACHE_MAX_ENTRIES, ttl=RENDER_CACHE_TTL)
+_render_inflight = {}
 
-def render_template_from_service(service_url: str, template: str, conn_data: dict) -> str:
+async def render_template_from_service(service_url: str, template: str, conn_data: dict) -> str:
     try:
         jwt_token = generate_jwt()
 
@@ -37,7 +39,7 @@ def render_template_from_service(service_url: str, template: str, conn_data: dic
             "template": str(template),
         }
 
-        resp = requests.post(
+        resp = await get_http_client("render").post(
             f"{service_url}/render",
             json=payload,
             headers=headers,
@@ -50,73 +52,199 @@ def render_template_from_service(service_url: str, template: str, conn_data: dic
             print(f"Erreur rendu template : {resp.status_code} - {resp.text}")
     except Exception as e:
         print(f"Exception lors du rendu template : {e}")
-    return "[Erreur de rendu]"
-
-def retrieve_documents(client, collection_name, query, k=5, threshold=0, document_filter=None, apply_contextual_filter=False):
-    query_vector = get_embedding([query])[0]
-    filter_conditions = []
+    return RENDER_ERROR
+
+def _build_filter(document_filter, apply_contextual_filter=False, categories=None):
+    # Filtrer par source
+    filter_conditions = [
+        FieldCondition(
+            key="source",
+            match=MatchAny(any=document_filter)
+        )
+    ]
 
-    if document_filter:
-        # Filtrer par source
+    # Pré-filtre par catégories détectées dans la question (payload des articles importés)
+    if categories:
         filter_conditions.append(
             FieldCondition(
-                key="source",
-                match=MatchAny(any=document_filter)
+                key="categories",
+                match=MatchAny(any=categories)
             )
         )
 
-        # Si c'est une connexion, on applique le filtre "contextual = true"
-        if apply_contextual_filter:
-            filter_conditions.append(
-                FieldCondition(
-                    key="contextual",
-                    match=MatchValue(value="true")
-                )
+    # Si c'est une connexion, on applique le filtre "contextual = true"
+    if apply_contextual_filter:
+        filter_conditions.append(
+            FieldCondition(
+                key="contextual",
+                match=MatchValue(value="true")
             )
+        )
 
-        filter_condition = Filter(must=filter_conditions)
-    else:
-        print("[Info] Aucun document_filter spécifié, pas de récupération possible.")
-        return []
+    return Filter(must=filter_conditions)
 
-    search_result = client.search(
-        collection_name=collection_name,
-        query_vector=query_vector,
-        limit=k,
-        with_payload=True,
-        query_filter=filter_condition,
-        with_vectors=False
-    )
 
-    documents = []
-    for hit in search_result:
-        if hit.score <= threshold:
-            continue
+def _is_template(payload) -> bool:
+    return str(payload.get("template", "")).lower() == "true"
 
+
+def _get_connexion_for_template(source_name: str):
+    """Ligne postgresql_connexions (URL du service + paramètres) en un seul appel Supabase."""
+    try:
+        response = supabase.table("postgresql_connexions") \
+            .select("postgres_service_url, data_schema, host_name, port, user, password, database, ssl_mode") \
+            .eq("connexion_name", source_name) \
+            .single() \
+            .execute()
+        return response.data
+    except Exception as e:
+        print(f"[Erreur Supabase] Impossible de récupérer la connexion PostgreSQL '{source_name}': {e}")
+        return None
+
+
+async def _render_cached(source: str, template: str, conn_data: dict) -> str:
+    key = (source, hashlib.sha1(template.encode("utf-8")).hexdigest())
+    rendered = _render_cache.get(key)
+    if rendered is not None:
+        return rendered
+
+    # Un même template demandé plusieurs fois en parallèle n'est rendu qu'une fois
+    pending = _render_inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(render_template_from_service(
+            service_url=conn_data["postgres_service_url"],
+            template=template,
+            conn_data=conn_data
+        ))
+        _render_inflight[key] = pending
+        pending.add_done_callback(lambda _: _render_inflight.pop(key, None))
+    rendered = await asyncio.shield(pending)
+    if rendered != RENDER_ERROR:
+        _render_cache.set(key, rendered)
+    return rendered
+
+
+async def _hits_to_documents(hits, threshold=0, postgres_connexions=None):
+    hits = [hit for hit in hits if hit.score > threshold]
+
+    # Connexions nécessaires aux templates : une seule lecture par source
+    template_sources = list({
+        hit.payload.get("source", "") for hit in hits if _is_template(hit.payload)
+    })
+    if postgres_connexions is not None:
+        connexions = {source: postgres_connexions.get(source) for source in template_sources}
+    else:
+        rows = await asyncio.gather(*(
+            run_in_threadpool(_get_connexion_for_template, source) for source in template_sources
+        ))
+        connexions = dict(zip(template_sources, rows))
+
+    async def to_document(hit):
         payload = hit.payload
         text = payload.get("text", "")
         source = payload.get("source", "")
-        is_template = str(payload.get("template", "")).lower() == "true"
-
-        if is_template:
-            service_url = get_postgres_service_url(source)
-            if service_url:
-                res_conn = supabase.table("postgresql_connexions") \
-                    .select("data_schema, host_name, port, user, password, database, ssl_mode") \
-                    .eq("connexion_name", source) \
-                    .single().execute()
-
-                if res_conn.data:
-                    text = render_template_from_service(
-                        service_url=service_url,
-                        template=text,
-                        conn_data=res_conn.data
-                    )
-                else:
-                    print("Connexion non trouvée dans Supabase")
-
-        documents.append({
+
+        if _is_template(payload):
+            conn_data = connexions.get(source)
+            if conn_data and conn_data.get("postgres_service_url"):
+                text = await _render_cached(source, text, conn_data)
+            elif conn_data is None:
+                print("Connexion non trouvée dans Supabase")
+
+        document = {
             "text": text,
-            "source": source
-        })
-    return documents
+            "source": source,
+            "score": float(hit.score),
+        }
+        # Identifie l'article pour la fusion avec la recherche plein texte
+        if payload.get("numero"):
+            document["numero"] = payload["numero"]
+        return document
+
+    # Les templates sont rendus en parallèle
+    return list(await asyncio.gather(*(to_document(hit) for hit in hits)))
+
+
+async def search_collections(client, query_vector, searches, postgres_connexions=None):
+    """
+    Exécute plusieurs recherches avec un même vecteur de requête.
+    `searches` : liste de dicts {collection_name, document_filter, k, threshold, apply_contextual_filter, categories}.
+    Les recherches d'une même collection partent en un seul appel batch Qdrant,
+    les différentes collections sont interrogées en parallèle.
+    Retourne la liste des documents de chaque recherche, dans l'ordre de `searches`.
+    """
+    results = [[] for _ in searches]
+    by_collection = {}
+    for i, search in enumerate(searches):
+        # Sans document_filter, pas de récupération possible pour cette recherche
+        if not search.get("document_filter"):
+            continue
+        by_collection.setdefault(search["collection_name"], []).append(i)
+
+    async def search_collection(collection_name, indexes):
+        responses = await client.query_batch_points(
+            collection_name=collection_name,
+            requests=[
+                QueryRequest(
+                    query=list(map(float, query_vector)),
+                    filter=_build_filter(
+                        searches[i]["document_filter"],
+                        searches[i].get("apply_contextual_filter", False),
+                        searches[i].get("categories"),
+                    ),
+                    limit=searches[i].get("k", 5),
+                    with_payload=True,
+                    with_vector=False,
+                )
+                for i in indexes
+            ],
+        )
+        for i, response in zip(indexes, responses):
+            results[i] = await _hits_to_documents(
+                response.points, searches[i].get("threshold", 0), postgres_connexions
+            )
+
+    await asyncio.gather(*(
+        search_collection(name, indexes) for name, indexes in by_collection.items()
+    ))
+    return results
+
+
+async def retrieve_documents(client, collection_name, query, k=5, threshold=0, document_filter=None, apply_contextual_filter=False, postgres_connexions=None, query_vector=None):
+    """
+    `postgres_connexions` (connexion_name -> ligne postgresql_connexions, voir ChatbotConfig)
+    évite de relire Supabase pour chaque template à rendre.
+    `query_vector` permet de réutiliser un embedding déjà calculé pour `query`.
+    Si le reclassement est activé (RERANK_ENABLED), RERANK_CANDIDATES candidats sont
+    récupérés puis reclassés par le cross-encoder, et les `k` meilleurs sont conservés
+    (sauf pour les connexions, dont chaque template est rendu par une requête SQL distante).
+    """
+    if not document_filter:
+        print("[Info] Aucun document_filter spécifié, pas de récupération possible.")
+        return []
+
+    if query_vector is None:
+        embeddings = await get_embedding([query])
+        if embeddings is None:
+            print(f"[Erreur] Embedding indisponible, aucune recherche dans '{collection_name}'.")
+            return []
+        query_vector = embeddings[0]
+
+    candidates = k
+    if reranker is not None and collection_name != POSTGRESS_COLLECTION_NAME:
+        candidates = max(k, RERANK_CANDIDATES)
+    results = await search_collections(
+        client,
+        query_vector,
+        [{
+            "collection_name": collection_name,
+            "document_filter": document_filter,
+            "k": candidates,
+            "threshold": threshold,
+            "apply_contextual_filter": apply_contextual_filter,
+        }],
+        postgres_connexions,
+    )
+    if reranker is not None:
+        return await reranker.rerank(query, results[0], top_n=k)
+    return results[0]
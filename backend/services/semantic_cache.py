@@ -0,0 +1,147 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_MAX_NAMESPACES,
+)
+
+# Nombres de la question (numéros d'articles, montants, années) : doivent être identiques
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+class _VectorIndex:
+    """
+    Index vectoriel en mémoire pour un chatbot : matrice de vecteurs normalisés,
+    recherche exacte par produit scalaire (quelques milliers d'entrées : < 1 ms).
+    Les entrées les plus anciennes sont remplacées une fois `max_entries` atteint.
+    """
+
+    def __init__(self, dim: int, max_entries: int):
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.numbers = np.zeros(max_entries, dtype=np.int64)
+        self.entries: List[Optional[dict]] = [None] * max_entries
+        self.size = 0
+        self.next = 0
+
+    def add(self, vector: np.ndarray, numbers: int, entry: dict):
+        self.vectors[self.next] = vector
+        self.expires_at[self.next] = entry["expires_at"]
+        self.numbers[self.next] = numbers
+        self.entries[self.next] = entry
+        self.next = (self.next + 1) % len(self.entries)
+        self.size = min(self.size + 1, len(self.entries))
+
+    def best(self, vector: np.ndarray, numbers: int, now: float):
+        """Meilleure entrée parmi celles non expirées et portant les mêmes nombres."""
+        if self.size == 0:
+            return None, 0.0
+        scores = self.vectors[: self.size] @ vector
+        valid = (self.expires_at[: self.size] >= now) & (self.numbers[: self.size] == numbers)
+        if not valid.any():
+            return None, 0.0
+        scores = np.where(valid, scores, -np.inf)
+        i = int(np.argmax(scores))
+        return self.entries[i], float(scores[i])
+
+
+class SemanticCache:
+    """
+    Cache de réponses par similarité : une question dont l'embedding est à une
+    similarité cosinus >= `threshold` d'une question déjà traitée (même namespace)
+    et contenant les mêmes nombres réutilise la réponse finale.
+    Namespace : "<chatbot_id>:<version de configuration>" ; une seule version est gardée
+    par chatbot, et au plus `max_namespaces` chatbots (les moins récemment utilisés sont retirés).
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float, max_namespaces: int = 64):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_namespaces = max_namespaces
+        self.hits = 0
+        self.misses = 0
+        self._indexes: "OrderedDict[str, _VectorIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _numbers(question: str) -> int:
+        # Empreinte des nombres de la question : "article 221-1" et "article 221-2" diffèrent
+        return hash(tuple(NUMBER_PATTERN.findall(question or "")))
+
+    @staticmethod
+    def _chatbot(namespace: str) -> str:
+        return namespace.rsplit(":", 1)[0]
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm else None
+
+    def lookup(self, namespace: str, vector, question: str) -> Optional[dict]:
+        v = self._normalize(vector)
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if v is None or index is None or index.vectors.shape[1] != v.shape[0]:
+                self.misses += 1
+                return None
+            self._indexes.move_to_end(namespace)
+            entry, score = index.best(v, self._numbers(question), time.monotonic())
+            if entry is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {**entry, "score": score}
+
+    def add(self, namespace: str, vector, question: str, answer: str, documents: List[str]):
+        v = self._normalize(vector)
+        if v is None:
+            return
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None or index.vectors.shape[1] != v.shape[0]:
+                # Versions précédentes de la configuration du chatbot : plus jamais consultées
+                chatbot = self._chatbot(namespace)
+                for ns in [ns for ns in self._indexes if ns != namespace and self._chatbot(ns) == chatbot]:
+                    del self._indexes[ns]
+                index = _VectorIndex(v.shape[0], self.max_entries)
+                self._indexes[namespace] = index
+                while len(self._indexes) > self.max_namespaces:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(namespace)
+            index.add(v, self._numbers(question), {
+                "question": question,
+                "answer": answer,
+                "documents": documents,
+                "expires_at": time.monotonic() + self.ttl,
+            })
+
+    def clear(self, namespace_prefix: str = ""):
+        with self._lock:
+            for ns in [ns for ns in self._indexes if ns.startswith(namespace_prefix)]:
+                del self._indexes[ns]
+
+    def stats(self) -> dict:
+        return {
+            "namespaces": len(self._indexes),
+            "entries": sum(i.size for i in self._indexes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "threshold": self.threshold,
+        }
+
+
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl=SEMANTIC_CACHE_TTL,
+    max_namespaces=SEMANTIC_CACHE_MAX_NAMESPACES,
+) if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from config import (
+    SOURCE_ROUTER_ENABLED,
+    SOURCE_ROUTER_MIN_SCORE,
+    SOURCE_ROUTER_MARGIN,
+    SOURCE_ROUTER_AMBIGUITY_GAP,
+    SOURCE_ROUTER_CACHE_MAX_ENTRIES,
+)
+from .cache import TTLCache
+from .embedding import get_embedding
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _source_text(source: Dict) -> str:
+    description = (source.get("description") or "").strip()
+    return f"{source['name']} : {description}" if description else str(source["name"])
+
+
+class SourceRouter:
+    """
+    Sélection locale des sources d'un chatbot par similarité cosinus entre la question
+    et la description de chaque source (embeddings calculés une fois par version de configuration).
+    - les sources à moins de `margin` du meilleur score sont retenues ensemble ;
+    - le routage est jugé ambigu (None : repli sur le LLM) si le meilleur score est
+      inférieur à `min_score`, ou si une source écartée est à moins de `gap` de la sélection.
+    """
+
+    def __init__(self, min_score: float, margin: float, gap: float, cache_size: int = 1024):
+        self.min_score = min_score
+        self.margin = margin
+        self.gap = gap
+        # Pas d'expiration : une nouvelle version de configuration a sa propre clé
+        self._indexes = TTLCache(maxsize=cache_size, ttl=float("inf"))
+        self._lock = threading.Lock()
+        self._stats = {"routed": 0, "ambiguous": 0, "unavailable": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _index_key(namespace: str, sources: List[Dict]) -> str:
+        h = hashlib.sha256(namespace.encode("utf-8"))
+        for source in sources:
+            h.update(b"\x1e")
+            h.update(f"{source.get('type')}\x1f{_source_text(source)}".encode("utf-8"))
+        return h.hexdigest()
+
+    async def _index(self, namespace: str, sources: List[Dict]) -> Optional[np.ndarray]:
+        key = self._index_key(namespace, sources)
+        matrix = self._indexes.get(key)
+        if matrix is None:
+            embeddings = await get_embedding([_source_text(s) for s in sources])
+            if embeddings is None:
+                return None
+            matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+            self._indexes.set(key, matrix)
+        return matrix
+
+    async def route(self, namespace: str, question: str, sources: List[Dict], question_vector=None) -> Optional[List[Dict]]:
+        """
+        Sources retenues pour `question` parmi `sources` (forme de candidate_sources),
+        ou None si le routage est ambigu ou impossible (embeddings indisponibles).
+        `namespace` identifie la configuration (chatbot et version).
+        """
+        if not sources:
+            return []
+
+        matrix = await self._index(namespace, sources)
+        if question_vector is None:
+            embeddings = await get_embedding([question])
+            question_vector = embeddings[0] if embeddings is not None else None
+        if matrix is None or question_vector is None:
+            self._count("unavailable")
+            return None
+
+        q = np.asarray(question_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        if not norm or q.shape[0] != matrix.shape[1]:
+            self._count("unavailable")
+            return None
+        scores = matrix @ (q / norm)
+
+        best = float(scores.max())
+        selected = scores >= best - self.margin
+        rejected = scores[~selected]
+        if best < self.min_score or (rejected.size and float(rejected.max()) >= best - self.margin - self.gap):
+            self._count("ambiguous")
+            return None
+
+        self._count("routed")
+        return [source for source, keep in zip(sources, selected) if keep]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "indexes": len(self._indexes)}
+
+
+source_router = SourceRouter(
+    SOURCE_ROUTER_MIN_SCORE,
+    SOURCE_ROUTER_MARGIN,
+    SOURCE_ROUTER_AMBIGUITY_GAP,
+    cache_size=SOURCE_ROUTER_CACHE_MAX_ENTRIES,
+) if SOURCE_ROUTER_ENABLED else None
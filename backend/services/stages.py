@@ -0,0 +1,48 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+
+
+async def _timed(name: str, awaitable: Awaitable, timings: Dict[str, float]):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+async def run_stages(
+    stages: Dict[str, Optional[Awaitable]], logs: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Exécute en parallèle des étapes indépendantes du pipeline et retourne
+    leurs résultats indexés par nom. La latence totale est celle de l'étape
+    la plus lente, et non plus la somme des étapes.
+
+    Une étape à None est ignorée (résultat None). Si une étape échoue,
+    les autres sont annulées et l'exception est propagée.
+    """
+    timings: Dict[str, float] = {}
+    results: Dict[str, Any] = {name: None for name in stages}
+    tasks = {
+        name: asyncio.ensure_future(_timed(name, aw, timings))
+        for name, aw in stages.items()
+        if aw is not None
+    }
+    if not tasks:
+        return results
+
+    try:
+        values = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    results.update(zip(tasks.keys(), values))
+    if logs is not None:
+        logs.append(
+            "⏱️ Étapes parallèles : "
+            + ", ".join(f"{name}={ms:.0f} ms" for name, ms in timings.items())
+        )
+    return results
@@ -0,0 +1,41 @@
+# app/utils/article_numbers.py
+import re
+from typing import List, Optional
+
+# "Article 221-1", "221-1", "art. R625-1", "Article 221-5-1-A", "Article 222-14-4 B"...
+NUMERO_PATTERN = re.compile(
+    r'^\s*(?:art(?:icle)?\.?\s*)?([LRDA])?\s*(\d+(?:-\d+)*)(?:[\s-]*([A-Z]))?\s*$',
+    re.IGNORECASE,
+)
+
+# Partie législative (sans préfixe ou L), puis réglementaire (R, D), puis arrêtés (A)
+PREFIX_RANK = {"": 0, "L": 0, "R": 1, "D": 2, "A": 3}
+
+
+def parse_numero(numero: str):
+    """
+    Découpe un numéro d'article en (préfixe, composantes numériques, lettre finale).
+    Retourne None si le texte n'a pas la forme d'un numéro d'article.
+    """
+    m = NUMERO_PATTERN.match(numero or "")
+    if not m:
+        return None
+    prefix, digits, letter = m.groups()
+    return (prefix or "").upper(), [int(d) for d in digits.split("-")], (letter or "").upper()
+
+
+def numero_sort_key(numero: str) -> Optional[List[int]]:
+    """
+    Clé de tri naturelle stockée dans articles.numero_tri (INTEGER[]) :
+    [rang du préfixe, 221, 1] pour "Article 221-1", de sorte que 221-2 < 221-10.
+    Une lettre finale ajoute [0, rang] : 221-1 < 221-1 A < 221-1-1.
+    """
+    parsed = parse_numero(numero)
+    if parsed is None:
+        return None
+    prefix, parts, letter = parsed
+    key = [PREFIX_RANK[prefix], *parts]
+    if letter:
+        key += [0, ord(letter) - ord("A") + 1]
+    return key
+
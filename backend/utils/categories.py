@@ -0,0 +1,66 @@
+# app/utils/categories.py
+import hashlib
+import json
+import re
+from typing import Dict, List
+
+CATEGORIES_MOTS_CLES = {
+    "Crimes": ["meurtre", "assassinat", "viol", "homicide"],
+    "Délits": ["vol", "escroquerie", "abus", "agression"],
+    "Contraventions": ["stationnement", "tapage", "contravention"],
+    "Droit de la famille": ["mariage", "divorce", "pacs", "époux"],
+    "Droit des biens": ["propriété", "possession", "usufruit", "immobilier"],
+    "Droit des obligations": ["contrat", "convention", "engagement", "obligation"],
+    "Responsabilité civile": ["dommage", "réparation", "responsabilité"],
+    "Droit des successions et donations": ["héritage", "succession", "donation"]
+}
+CATEGORIE_PAR_DEFAUT = "Délits"
+
+
+class CategoryMatcher:
+    """
+    Détecte les catégories d'un texte en une seule passe : tous les mots-clés sont
+    compilés dans une alternance unique, limitée aux mots entiers (pluriels en s/x acceptés),
+    ainsi "vol" ne reconnaît plus "volontaire", ni "viol" le mot "violence".
+    """
+
+    def __init__(self, mapping: Dict[str, List[str]]):
+        self.categories_par_mot = {}
+        for categorie, mots in mapping.items():
+            for mot in mots:
+                self.categories_par_mot.setdefault(mot.lower(), []).append(categorie)
+        # Les mots les plus longs d'abord, pour que l'alternance préfère la correspondance la plus longue
+        alternance = "|".join(
+            re.escape(mot) for mot in sorted(self.categories_par_mot, key=len, reverse=True)
+        )
+        self.pattern = re.compile(rf"\b({alternance})[sx]?\b", re.IGNORECASE)
+        # Empreinte des mots-clés et du motif : change dès que la détection change
+        self.version = hashlib.sha1(
+            json.dumps([mapping, self.pattern.pattern], ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def mots_cles(self, texte: str) -> Dict[str, int]:
+        """Mots-clés trouvés et leur nombre d'occurrences."""
+        compte = {}
+        for m in self.pattern.finditer(texte or ""):
+            mot = m.group(1).lower()
+            compte[mot] = compte.get(mot, 0) + 1
+        return compte
+
+    def scores(self, texte: str) -> Dict[str, int]:
+        """Catégories trouvées, de la plus à la moins citée (score = occurrences de ses mots-clés)."""
+        scores = {}
+        for mot, n in self.mots_cles(texte).items():
+            for categorie in self.categories_par_mot[mot]:
+                scores[categorie] = scores.get(categorie, 0) + n
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def categories(self, texte: str) -> List[str]:
+        return list(self.scores(texte))
+
+    def categorie_principale(self, texte: str, defaut: str = CATEGORIE_PAR_DEFAUT) -> str:
+        scores = self.scores(texte)
+        return next(iter(scores), defaut)
+
+
+category_matcher = CategoryMatcher(CATEGORIES_MOTS_CLES)
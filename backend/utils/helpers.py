@@ -16,8 +16,14 @@ def get_slots_for_chatbot(chatbot_id: str):
     if not response or not getattr(response, "data", None):
         return []
 
+    return slots_from_associations(response.data)
+
+def slots_from_associations(associations):
+    """
+    Construit la liste des slots à partir des lignes de chatbot_slot_associations (avec slots(*)).
+    """
     slots = []
-    for assoc in response.data:
+    for assoc in associations:
         if "slots" in assoc and assoc["slots"] is not None:
             slot_data = {
                 "slot_name": assoc["slots"]["slot_name"],
@@ -62,8 +68,14 @@ def get_possible_values_for_chatbot(chatbot_id: str):
     if not response or not getattr(response, "data", None):
         return []
 
+    return possible_values_from_associations(response.data)
+
+def possible_values_from_associations(associations):
+    """
+    Liste plate des valeurs possibles à partir des lignes de chatbot_slot_associations (avec slots(*)).
+    """
     values = []
-    for assoc in response.data:
+    for assoc in associations:
         slot = assoc.get("slots")
         if slot and slot.get("valeurs_possibles"):
             # Récupère uniquement le label si c'est un dict
@@ -1,12 +1,37 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
 import os
+import random
 import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import httpx
+import numpy as np
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from backend.config import *
+from backend.utils.article_numbers import numero_sort_key
+from backend.utils.categories import category_matcher, CATEGORIE_PAR_DEFAUT
 
 # Regex
 ARTICLE_PATTERN = re.compile(r'^Article\s+[A-Z]?\d+(?:-\d+)*', re.IGNORECASE)
 AMENDE_PATTERN = re.compile(r'(\d+(?:\s?\d{3})*)\s*€\s*d\'amende', re.IGNORECASE)
+# Dossiers "Livre II", "Titre Ier", "Chapitre III"... -> colonnes livre / titre / chapitre / section
+NIVEAU_PATTERN = re.compile(r'^(Livre|Titre|Chapitre|Section)\b', re.IGNORECASE)
+
+# Découpage pour l'index vectoriel
+CHUNK_MAX_CHARS = 1200
+EMBED_BATCH_SIZE = 256
+# Version de l'extraction (lecture, nettoyage, catégories) : à incrémenter quand elle change,
+# pour que les articles déjà importés soient recalculés
+PARSER_VERSION = "2"
+# Espace de noms des identifiants de points Qdrant (uuid5 de code|numero|chunk)
+QDRANT_NAMESPACE = uuid.UUID("6f1c0a52-7c1e-4f5e-9a53-2b8f3d0c4e71")
 
 
 # ---------------------------------------------------------
@@ -70,7 +95,10 @@ def create_tables(conn):
                 chapitre TEXT,
                 section TEXT,
                 numero TEXT NOT NULL,
+                numero_tri INTEGER[],
                 contenu TEXT NOT NULL,
+                content_hash TEXT,
+                qdrant_hash TEXT,
                 mots_cles TEXT,
                 categories TEXT,
                 categorie_id INTEGER REFERENCES categories(id),
@@ -78,9 +106,49 @@ def create_tables(conn):
             );
         """)
 
+        # Clé de tri naturelle (tables créées avant son ajout)
+        cur.execute("ALTER TABLE articles ADD COLUMN IF NOT EXISTS numero_tri INTEGER[];")
+        # Empreinte du fichier source (import incrémental)
+        cur.execute("ALTER TABLE articles ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+        # Empreinte de la version indexée dans Qdrant (renseignée après un upsert réussi)
+        cur.execute("ALTER TABLE articles ADD COLUMN IF NOT EXISTS qdrant_hash TEXT;")
+
         # Index pour recherche
         cur.execute("CREATE INDEX IF NOT EXISTS idx_article_numero ON articles (numero);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_article_fts ON articles USING GIN (to_tsvector('french', contenu));")
+        # Lignes importées avant l'ajout de numero_tri : clé calculée à partir du numéro
+        cur.execute("SELECT id, numero FROM articles WHERE numero_tri IS NULL")
+        a_completer = [(id_, cle) for id_, numero in cur.fetchall() if (cle := numero_sort_key(numero)) is not None]
+        if a_completer:
+            execute_values(cur, """
+                UPDATE articles SET numero_tri = v.numero_tri
+                FROM (VALUES %s) AS v (id, numero_tri)
+                WHERE articles.id = v.id
+            """, a_completer, template="(%s, %s::integer[])")
+            print(f"✅ numero_tri renseigné pour {len(a_completer)} article(s) existant(s)")
+
+        # Parcours ordonnés (clé de tri puis id, unique) et recherches par numéro en index-only scan
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_article_numero_tri_id ON articles (numero_tri, id) INCLUDE (numero);")
+        # Remplacé par idx_article_numero_tri_id
+        cur.execute("DROP INDEX IF EXISTS idx_article_numero_tri;")
+
+        # Recherche plein texte pondérée : numéro et titre (A) avant le contenu (B)
+        cur.execute("""
+            ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('french', coalesce(numero, '') || ' ' || coalesce(titre, '')), 'A') ||
+                setweight(to_tsvector('french', contenu), 'B')
+            ) STORED;
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_article_search ON articles USING GIN (search_vector);")
+        # Remplacé par idx_article_search
+        cur.execute("DROP INDEX IF EXISTS idx_article_fts;")
+
+        # Filtre par catégories (liste séparée par des virgules)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_article_categories ON articles USING GIN (string_to_array(categories, ','));")
+
+        # Recherche floue (fautes de frappe) par trigrammes
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_article_contenu_trgm ON articles USING GIN (contenu gin_trgm_ops);")
 
         conn.commit()
         print("✅ Tables 'articles' et 'categories' créées / mises à jour.")
@@ -89,99 +157,405 @@ def create_tables(conn):
 # ---------------------------------------------------------
 #  🧠 Détection automatique de la catégorie
 # ---------------------------------------------------------
-def detecter_categorie(contenu, conn):
-    contenu_lower = contenu.lower()
-    mapping = {
-        "Crimes": ["meurtre", "assassinat", "viol", "homicide"],
-        "Délits": ["vol", "escroquerie", "abus", "agression"],
-        "Contraventions": ["stationnement", "tapage", "contravention"],
-        "Droit de la famille": ["mariage", "divorce", "pacs", "époux"],
-        "Droit des biens": ["propriété", "possession", "usufruit", "immobilier"],
-        "Droit des obligations": ["contrat", "convention", "engagement", "obligation"],
-        "Responsabilité civile": ["dommage", "réparation", "responsabilité"],
-        "Droit des successions et donations": ["héritage", "succession", "donation"]
-    }
+def detecter_categorie(contenu):
+    """Catégorie principale de l'article (sans accès à la base)."""
+    return category_matcher.categorie_principale(contenu)
 
-    for categorie, mots in mapping.items():
-        if any(mot in contenu_lower for mot in mots):
-            with conn.cursor() as cur:
-                # Crée la catégorie si elle n'existe pas
-                cur.execute("""
-                    INSERT INTO categories (nom)
-                    VALUES (%s)
-                    ON CONFLICT (nom) DO NOTHING;
-                """, (categorie,))
-                conn.commit()
-
-                cur.execute("SELECT id FROM categories WHERE nom = %s", (categorie,))
-                row = cur.fetchone()
-                if row:
-                    return row[0]
-
-    # Défaut : Délits
+
+def charger_categories(conn, noms):
+    """
+    Table nom -> id des catégories, chargée une seule fois :
+    les catégories manquantes sont créées en une requête.
+    """
     with conn.cursor() as cur:
         cur.execute("""
             INSERT INTO categories (nom)
-            VALUES ('Délits')
+            SELECT unnest(%s::text[])
             ON CONFLICT (nom) DO NOTHING;
+        """, (sorted(noms),))
+        cur.execute("SELECT nom, id FROM categories")
+        return dict(cur.fetchall())
+
+
+# ---------------------------------------------------------
+#  📄 Lecture d'un fichier (exécutée dans les processus du pool)
+# ---------------------------------------------------------
+def hierarchie_depuis_chemin(file_path, root_folder):
+    """Partie / livre / titre / chapitre / section déduits des dossiers parents."""
+    dossiers = os.path.relpath(os.path.dirname(file_path), root_folder).split(os.sep)
+    hierarchie = {"partie": None, "livre": None, "titre": None, "chapitre": None, "section": None}
+    for dossier in dossiers:
+        m = NIVEAU_PATTERN.match(dossier)
+        if m:
+            hierarchie[m.group(1).lower()] = dossier
+        elif dossier.startswith("Partie"):
+            hierarchie["partie"] = dossier
+    return hierarchie
+
+
+def lire_article(file_path, root_folder):
+    with open(file_path, "rb") as f:
+        raw = f.read()
+
+    lines = raw.decode("utf-8").splitlines()
+    if not lines:
+        return None
+
+    first_line = lines[0].strip()
+    if not ARTICLE_PATTERN.match(first_line):
+        print(f"⚠️ Format ignoré : {first_line} dans {os.path.basename(file_path)}")
+        return None
+
+    contenu = nettoyer_contenu("\n".join(lines[1:]).strip())
+    scores = category_matcher.scores(contenu)
+    return {
+        **hierarchie_depuis_chemin(file_path, root_folder),
+        "numero": first_line,
+        "numero_tri": numero_sort_key(first_line),
+        "contenu": contenu,
+        "categorie": next(iter(scores), CATEGORIE_PAR_DEFAUT),
+        # Toutes les catégories reconnues et leurs mots-clés (filtrage à la recherche)
+        "categories": list(scores),
+        "mots_cles": list(category_matcher.mots_cles(contenu)),
+        # Empreinte du fichier et de l'extraction : un article inchangé n'est pas réimporté,
+        # sauf si le parseur ou les mots-clés des catégories ont changé
+        "content_hash": hashlib.sha1(
+            f"{PARSER_VERSION}|{category_matcher.version}|".encode("utf-8") + raw
+        ).hexdigest(),
+    }
+
+
+def lister_fichiers(root_folder):
+    for root, _, files in os.walk(root_folder):
+        for filename in files:
+            if filename.endswith(".md"):
+                yield os.path.join(root, filename)
+
+
+# ---------------------------------------------------------
+#  📦 Chargement en masse (COPY + fusion)
+# ---------------------------------------------------------
+STAGING_COLUMNS = [
+    "livre", "titre", "chapitre", "section", "numero", "numero_tri", "contenu",
+    "mots_cles", "categories", "categorie_id", "content_hash",
+]
+
+
+def _pg_array(values):
+    return "{" + ",".join(map(str, values)) + "}" if values is not None else None
+
+
+def copier_articles(conn, articles):
+    """
+    Charge les articles dans une table temporaire via COPY, puis les fusionne
+    dans `articles` en une seule requête (mise à jour des existants, insertion des nouveaux).
+    Retourne (nombre mis à jour, nombre inséré).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for a in articles:
+        writer.writerow([
+            a["livre"], a["titre"], a["chapitre"], a["section"],
+            a["numero"], _pg_array(a["numero_tri"]), a["contenu"],
+            ",".join(a["mots_cles"]), ",".join(a["categories"]), a["categorie_id"], a["content_hash"],
+        ])
+    buffer.seek(0)
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE articles_staging (
+                livre TEXT,
+                titre TEXT,
+                chapitre TEXT,
+                section TEXT,
+                numero TEXT PRIMARY KEY,
+                numero_tri INTEGER[],
+                contenu TEXT NOT NULL,
+                mots_cles TEXT,
+                categories TEXT,
+                categorie_id INTEGER,
+                content_hash TEXT NOT NULL
+            ) ON COMMIT DROP;
         """)
-        conn.commit()
-        cur.execute("SELECT id FROM categories WHERE nom = 'Délits'")
-        row = cur.fetchone()
-        return row[0] if row else None
+        cur.copy_expert(
+            f"COPY articles_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        # code est NULL pour ces articles : UNIQUE (code, numero) ne détecte pas les doublons,
+        # la correspondance se fait donc explicitement sur le numéro
+        cur.execute("""
+            WITH updated AS (
+                UPDATE articles a
+                SET livre = s.livre,
+                    titre = s.titre,
+                    chapitre = s.chapitre,
+                    section = s.section,
+                    numero_tri = s.numero_tri,
+                    contenu = s.contenu,
+                    mots_cles = s.mots_cles,
+                    categories = s.categories,
+                    categorie_id = s.categorie_id,
+                    content_hash = s.content_hash,
+                    updated_at = NOW()
+                FROM articles_staging s
+                WHERE a.code IS NULL AND a.numero = s.numero
+                RETURNING a.numero
+            ),
+            inserted AS (
+                INSERT INTO articles (
+                    livre, titre, chapitre, section, numero, numero_tri, contenu,
+                    mots_cles, categories, categorie_id, content_hash, created_at, updated_at
+                )
+                SELECT s.livre, s.titre, s.chapitre, s.section, s.numero, s.numero_tri, s.contenu,
+                       s.mots_cles, s.categories, s.categorie_id, s.content_hash, NOW(), NOW()
+                FROM articles_staging s
+                WHERE s.numero NOT IN (SELECT numero FROM updated)
+                RETURNING numero
+            )
+            SELECT (SELECT COUNT(*) FROM updated), (SELECT COUNT(*) FROM inserted);
+        """)
+        return cur.fetchone()
+
+
+# ---------------------------------------------------------
+#  🧭 Indexation vectorielle (Qdrant)
+# ---------------------------------------------------------
+def decouper_article(article, max_chars=CHUNK_MAX_CHARS):
+    """
+    Découpe un article en passages d'au plus `max_chars` caractères (par paragraphes).
+    Chaque passage est précédé de sa position dans le code et du numéro d'article.
+    """
+    niveaux = [article[k] for k in ("partie", "livre", "titre", "chapitre", "section") if article[k]]
+    entete = " > ".join(niveaux + [article["numero"]])
+
+    paragraphes = [p.strip() for p in article["contenu"].splitlines() if p.strip().strip("-")]
+    passages, courant = [], ""
+    for paragraphe in paragraphes:
+        if courant and len(courant) + len(paragraphe) + 1 > max_chars:
+            passages.append(courant)
+            courant = paragraphe
+        else:
+            courant = f"{courant}\n{paragraphe}" if courant else paragraphe
+    if courant or not passages:
+        passages.append(courant)
+    return [f"{entete}\n{passage}" for passage in passages]
+
+
+def empreinte_qdrant(article, source):
+    """Empreinte de l'article tel qu'indexé dans Qdrant pour `source`."""
+    return hashlib.sha1(f"{source}|{article['content_hash']}".encode("utf-8")).hexdigest()
+
+
+def marquer_indexes(conn, articles, source):
+    """Enregistre la version indexée des articles, une fois l'indexation Qdrant réussie."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE articles a
+            SET qdrant_hash = s.qdrant_hash
+            FROM unnest(%s::text[], %s::text[]) AS s (numero, qdrant_hash)
+            WHERE a.code IS NULL AND a.numero = s.numero;
+        """, ([a["numero"] for a in articles], [empreinte_qdrant(a, source) for a in articles]))
+    conn.commit()
+
+
+def point_id(code, numero, chunk):
+    """Identifiant stable : réindexer un article écrase ses points au lieu de les dupliquer."""
+    return str(uuid.uuid5(QDRANT_NAMESPACE, f"{code}|{numero}|{chunk}"))
+
+
+_modele_local = None
+
+
+def _embeddings_locaux(textes):
+    """Même modèle que le backend en mode EMBEDDING_BACKEND=local (ONNX si disponible)."""
+    global _modele_local
+    if _modele_local is None:
+        from sentence_transformers import SentenceTransformer
+
+        try:
+            model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+            _modele_local = SentenceTransformer(
+                EMBEDDING_LOCAL_MODEL, backend="onnx", device="cpu", model_kwargs=model_kwargs
+            )
+        except Exception as e:
+            print(f"⚠️ Modèle ONNX indisponible pour {EMBEDDING_LOCAL_MODEL}, utilisation de PyTorch : {e}")
+            _modele_local = SentenceTransformer(EMBEDDING_LOCAL_MODEL, device="cpu")
+    return _modele_local.encode(
+        textes, batch_size=len(textes), convert_to_numpy=True, show_progress_bar=False
+    ).astype(np.float32)
+
+
+async def calculer_embeddings(http, textes):
+    """
+    Embeddings des passages avec le backend configuré (API ou local), par lots de
+    EMBEDDING_BATCH_MAX_SIZE pour l'API, avec les mêmes relances que le backend.
+    Le script n'importe pas les services du backend : ils chargeraient `config` une seconde fois.
+    """
+    if EMBEDDING_BACKEND == "local":
+        return _embeddings_locaux(textes)
+
+    vecteurs = []
+    for start in range(0, len(textes), EMBEDDING_BATCH_MAX_SIZE):
+        lot = textes[start:start + EMBEDDING_BATCH_MAX_SIZE]
+        for attempt in range(EMBEDDING_RETRIES + 1):
+            try:
+                response = await http.post(
+                    EMBEDDING_API_URL, json={"texts": lot, "model": ""}, timeout=EMBEDDING_TIMEOUT
+                )
+                response.raise_for_status()
+                vecteurs.append(np.asarray(response.json()["embeddings"], dtype=np.float32))
+                break
+            except Exception:
+                if attempt == EMBEDDING_RETRIES:
+                    raise
+                await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+    return np.concatenate(vecteurs)
+
+
+async def indexer_articles_qdrant(articles, source):
+    """
+    Découpe, calcule les embeddings par grands lots et enregistre (upsert) les passages
+    des articles dans COLLECTION_NAME, avec `source` = nom de la source documentaire
+    utilisé par les filtres de recherche des chatbots.
+    """
+    from qdrant_client import AsyncQdrantClient
+    from qdrant_client.models import (
+        Distance, FieldCondition, Filter, MatchAny, MatchValue, PayloadSchemaType, PointStruct, VectorParams,
+    )
+
+    points = []
+    for a in articles:
+        for i, texte in enumerate(decouper_article(a)):
+            points.append((point_id(source, a["numero"], i), texte, {
+                "text": texte,
+                "source": source,
+                "numero": a["numero"],
+                "partie": a["partie"],
+                "livre": a["livre"],
+                "titre": a["titre"],
+                "chapitre": a["chapitre"],
+                "section": a["section"],
+                "categories": a["categories"],
+                "chunk": i,
+                "content_hash": a["content_hash"],
+            }))
+
+    client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    http = httpx.AsyncClient()
+    try:
+        for start in range(0, len(points), EMBED_BATCH_SIZE):
+            batch = points[start:start + EMBED_BATCH_SIZE]
+            vectors = await calculer_embeddings(http, [texte for _, texte, _ in batch])
+
+            if start == 0:
+                if not await client.collection_exists(COLLECTION_NAME):
+                    await client.create_collection(
+                        COLLECTION_NAME,
+                        vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE),
+                    )
+                for champ in ("source", "numero", "categories"):
+                    await client.create_payload_index(COLLECTION_NAME, champ, PayloadSchemaType.KEYWORD)
+
+            await client.upsert(COLLECTION_NAME, points=[
+                PointStruct(id=pid, vector=vector.tolist(), payload=payload)
+                for (pid, _, payload), vector in zip(batch, vectors)
+            ])
+            print(f"🧭 {start + len(batch)}/{len(points)} passages indexés dans Qdrant")
+
+        # Passages en trop d'un article raccourci : ils portent encore l'ancienne empreinte
+        await client.delete(COLLECTION_NAME, points_selector=Filter(
+            must=[
+                FieldCondition(key="source", match=MatchValue(value=source)),
+                FieldCondition(key="numero", match=MatchAny(any=[a["numero"] for a in articles])),
+            ],
+            must_not=[
+                FieldCondition(key="content_hash", match=MatchAny(any=[a["content_hash"] for a in articles])),
+            ],
+        ))
+    finally:
+        await client.close()
+        await http.aclose()
 
 
 # ---------------------------------------------------------
 #  📂 Importation des articles
 # ---------------------------------------------------------
-def insert_articles_from_folder(root_folder):
+def insert_articles_from_folder(root_folder, force=False, workers=None, source=None):
     create_database()
     conn = get_connection()
-    create_tables(conn)
+    try:
+        create_tables(conn)
 
-    with conn.cursor() as cur:
-        for root, _, files in os.walk(root_folder):
-            for filename in files:
-                if not filename.endswith(".md"):
-                    continue
-
-                file_path = os.path.join(root, filename)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-
-                if not lines:
-                    continue
-
-                first_line = lines[0].strip()
-                if not ARTICLE_PATTERN.match(first_line):
-                    print(f"⚠️ Format ignoré : {first_line} dans {filename}")
-                    continue
-
-                numero_article = first_line
-                contenu = nettoyer_contenu("".join(lines[1:]).strip())
-                categorie_id = detecter_categorie(contenu, conn)
-
-                cur.execute("""
-                    INSERT INTO articles (
-                        code, livre, titre, chapitre, section, numero, contenu, mots_cles, categories, categorie_id, created_at, updated_at
-                    )
-                    VALUES (NULL, NULL, NULL, NULL, NULL, %s, %s, NULL, NULL, %s, NOW(), NOW())
-                    ON CONFLICT (code, numero)
-                    DO UPDATE SET
-                        contenu = EXCLUDED.contenu,
-                        categorie_id = EXCLUDED.categorie_id,
-                        updated_at = NOW();
-                """, (numero_article, contenu, categorie_id))
+        # 1️⃣ Lecture et analyse des fichiers en parallèle
+        fichiers = list(lister_fichiers(root_folder))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            articles = [a for a in pool.map(partial(lire_article, root_folder=root_folder), fichiers, chunksize=64) if a]
 
-                print(f"✅ Article importé / mis à jour : {numero_article}")
+        # Un même numéro ne doit apparaître qu'une fois dans la table de transit
+        articles = list({a["numero"]: a for a in articles}.values())
 
-        conn.commit()
-    conn.close()
+        # 2️⃣ Articles inchangés depuis le dernier import ignorés ; l'indexation Qdrant est suivie
+        #    à part (qdrant_hash) : un article importé mais pas encore indexé le sera au prochain passage
+        a_importer, a_indexer = articles, articles if source else []
+        if not force:
+            with conn.cursor() as cur:
+                cur.execute("SELECT numero, content_hash, qdrant_hash FROM articles WHERE code IS NULL")
+                connus = {numero: (content_hash, qdrant_hash) for numero, content_hash, qdrant_hash in cur.fetchall()}
+            a_importer = [a for a in articles if connus.get(a["numero"], (None, None))[0] != a["content_hash"]]
+            if source:
+                a_indexer = [
+                    a for a in articles
+                    if connus.get(a["numero"], (None, None))[1] != empreinte_qdrant(a, source)
+                ]
+
+        print(
+            f"📄 {len(fichiers)} fichiers lus, {len(a_importer)} articles nouveaux ou modifiés"
+            + (f", {len(a_indexer)} à indexer dans Qdrant" if source else "")
+        )
+
+        # 3️⃣ Catégories résolues en mémoire, puis chargement en masse
+        if a_importer:
+            categories = charger_categories(conn, {a["categorie"] for a in a_importer})
+            for a in a_importer:
+                a["categorie_id"] = categories.get(a["categorie"])
+
+            updated, inserted = copier_articles(conn, a_importer)
+            conn.commit()
+            print(f"✅ {inserted} articles importés, {updated} mis à jour")
+
+        # 4️⃣ Articles dont la version indexée diffère dans l'index vectoriel,
+        #    marqués seulement si l'indexation réussit
+        if a_indexer:
+            asyncio.run(indexer_articles_qdrant(a_indexer, source))
+            marquer_indexes(conn, a_indexer, source)
+            print(f"🧭 {len(a_indexer)} articles indexés dans Qdrant")
+    finally:
+        conn.close()
 
 
 # ---------------------------------------------------------
 #  🚀 Exécution principale
 # ---------------------------------------------------------
 if __name__ == "__main__":
-    insert_articles_from_folder("./france.code-penal-master/")
+    parser = argparse.ArgumentParser(description="Import des articles du Code pénal")
+    parser.add_argument("dossier", nargs="?", default="./france.code-penal-master/")
+    parser.add_argument("--force", action="store_true", help="réimporte aussi les articles inchangés")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus de lecture")
+    parser.add_argument(
+        "--source",
+        default=ARTICLES_SOURCE_NAMES[0] if ARTICLES_SOURCE_NAMES else "Code pénal",
+        help="nom de la source documentaire dans Qdrant",
+    )
+    parser.add_argument(
+        "--qdrant", action="store_true",
+        help=f"indexe aussi les passages dans la collection Qdrant '{COLLECTION_NAME}' (sinon PostgreSQL seul)",
+    )
+    args = parser.parse_args()
+
+    insert_articles_from_folder(
+        args.dossier,
+        force=args.force,
+        workers=args.workers,
+        source=args.source if args.qdrant else None,
+    )
     print("✅ Import terminé !")